@@ -0,0 +1,89 @@
+"""
+Benchmark of reading the hourly temperatures of many points from a memory
+mapped archive against decoding and parsing their json api results,
+using the 71 step fixture from test_smhi_lib.
+
+    python -m benchmarks.bench_archive --points 2000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from smhi import smhi_archive
+from smhi.smhi_archive import SmhiForecastArchive, write_archive
+from smhi.smhi_frame import ForecastFrame
+from smhi.smhi_lib import JSON_LOADS, _get_all_forecast_from_api
+from smhi.test_smhi_lib import FakeSmhiApi
+
+TEMPERATURE = frozenset(("t",))
+
+
+def read_json(bodies) -> float:
+    """Decodes and parses only the temperature of each api result, returns
+    the sum of the temperatures"""
+    total = 0.0
+    for body in bodies:
+        days = _get_all_forecast_from_api(JSON_LOADS(body), TEMPERATURE)
+        for forecasts in days.values():
+            for forecast in forecasts:
+                total += forecast.temperature
+    return total
+
+
+def read_archive(path: str) -> float:
+    """Maps the archive, returns the sum of the temperatures"""
+    with SmhiForecastArchive(path) as archive:
+        column = archive.column("temperature")
+        if smhi_archive.np is not None:
+            total = float(column.sum())
+        else:
+            total = sum(sum(row) for row in column.tolist())
+        del column
+    return total
+
+
+def measure(function, argument, repeat: int) -> float:
+    """Returns the best time in seconds of the function"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--points", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    api_result = FakeSmhiApi().get_forecast_api("", "")
+    bodies = [json.dumps(api_result).encode("utf-8")] * args.points
+    frame = ForecastFrame.from_api(api_result)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "forecasts.arc")
+        write_archive(
+            path,
+            [frame] * args.points,
+            [(17.0 + point * 0.05, 62.1) for point in range(args.points)],
+        )
+        print("points: {}, archive {} bytes".format(args.points, os.path.getsize(path)))
+        json_time = measure(read_json, bodies, args.repeat)
+        archive_time = measure(read_archive, path, args.repeat)
+
+    for name, elapsed in (("json", json_time), ("archive", archive_time)):
+        print(
+            "{:10} {:8.2f} us/point {:8.2f}x".format(
+                name + ":", elapsed / args.points * 1e6, json_time / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark of the daily summary in _get_daily_forecasts against the
+copy.deepcopy based version it replaced, on a batch of parsed copies of
+the fixture from test_smhi_lib.
+
+    python -m benchmarks.bench_daily --payloads 1000
+"""
+
+import argparse
+import copy
+import time
+
+from collections import OrderedDict
+from typing import List
+
+from smhi.smhi_lib import (
+    SmhiForecast,
+    _get_all_forecast_from_api,
+    _get_daily_forecasts,
+)
+from smhi.test_smhi_lib import FakeSmhiApi
+
+
+# pylint: disable=W0212
+def legacy_get_daily_forecasts(forecasts_ordered: OrderedDict) -> List[SmhiForecast]:
+    """The deepcopy based daily summary, kept for comparison"""
+    forecasts = []
+    day_nr = 1
+
+    for day in forecasts_ordered:
+        forecasts_day = forecasts_ordered[day]
+
+        if day_nr == 1:
+            forecasts.append(copy.deepcopy(forecasts_day[0]))
+
+        total_precipitation = float(0.0)
+        forecast_temp_max = -100.0
+        forecast_temp_min = 100.0
+        forecast = None
+        for forcast_day in forecasts_day:
+            temperature = forcast_day.temperature
+            if forecast_temp_min > temperature:
+                forecast_temp_min = temperature
+            if forecast_temp_max < temperature:
+                forecast_temp_max = temperature
+            if forcast_day.valid_time.hour == 12:
+                forecast = copy.deepcopy(forcast_day)
+            total_precipitation = total_precipitation + forcast_day._total_precipitation
+
+        if forecast is None:
+            forecast = forecasts_day[0]
+
+        forecast._temperature_max = forecast_temp_max
+        forecast._temperature_min = forecast_temp_min
+        forecast._total_precipitation = total_precipitation
+        forecast._mean_precipitation = total_precipitation / 24
+        forecasts.append(forecast)
+        day_nr = day_nr + 1
+
+    return forecasts
+
+
+def measure(summarize, batch: list, repeat: int) -> float:
+    """Returns the best time in seconds to summarize the batch"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for forecasts_ordered in batch:
+            summarize(forecasts_ordered)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payloads", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = FakeSmhiApi().get_forecast_api("", "")
+    batch = [_get_all_forecast_from_api(payload) for _ in range(args.payloads)]
+    legacy = measure(legacy_get_daily_forecasts, batch, args.repeat)
+    current = measure(_get_daily_forecasts, batch, args.repeat)
+
+    print("payloads: {}".format(args.payloads))
+    print("deepcopy:       {:8.1f} us/call".format(legacy / args.payloads * 1e6))
+    print("new summaries:  {:8.1f} us/call".format(current / args.payloads * 1e6))
+    print("speedup:        {:8.2f}x".format(legacy / current))
+
+
+if __name__ == "__main__":
+    main()
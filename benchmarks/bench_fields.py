@@ -0,0 +1,57 @@
+"""
+Benchmark of get_forecast parsing with a fields projection against
+decoding the default parameters, using the 71 step fixture from
+test_smhi_lib.
+
+    python -m benchmarks.bench_fields --payloads 2000
+"""
+
+import argparse
+import time
+
+from smhi.smhi_lib import _get_forecast, _get_parameters
+from smhi.test_smhi_lib import FakeSmhiApi
+
+PROJECTIONS = (
+    ("default", None),
+    ("temperature", ("temperature",)),
+    ("temperature, symbol", ("temperature", "symbol")),
+    ("five fields", ("temperature", "symbol", "humidity", "wind_speed", "wind_gust")),
+)
+
+
+def measure(parameters, payload: dict, payloads: int, repeat: int) -> float:
+    """Returns the best time in seconds to parse the payloads"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(payloads):
+            _get_forecast(payload, parameters)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payloads", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = FakeSmhiApi().get_forecast_api("", "")
+    baseline = None
+    print("payloads: {}".format(args.payloads))
+    for name, fields in PROJECTIONS:
+        parameters = _get_parameters(None, fields)
+        elapsed = measure(parameters, payload, args.payloads, args.repeat)
+        if baseline is None:
+            baseline = elapsed
+        print(
+            "{:22} {:8.1f} us/call {:6.2f}x".format(
+                name + ":", elapsed / args.payloads * 1e6, baseline / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the json decoding of an api result, the str copy and stdlib
+json.loads the api used before against bytes in decoding with the stdlib
+and orjson, using the 71 step fixture from test_smhi_lib.
+
+    python -m benchmarks.bench_json --payloads 2000
+"""
+
+import argparse
+import json
+import time
+
+from smhi.smhi_lib import _get_forecast
+from smhi.test_smhi_lib import FakeSmhiApi
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def legacy_loads(data: bytes) -> dict:
+    """Decodes to str first like the api did before"""
+    return json.loads(data.decode("utf-8"))
+
+
+def measure(loads, body: bytes, payloads: int, repeat: int, parse: bool) -> float:
+    """Returns the best time in seconds to decode, and parse, the payloads"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(payloads):
+            json_data = loads(body)
+            if parse:
+                _get_forecast(json_data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payloads", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--parse", action="store_true", help="include _get_forecast in the time"
+    )
+    args = parser.parse_args()
+
+    body = json.dumps(FakeSmhiApi().get_forecast_api("", "")).encode("utf-8")
+    backends = [("str + json", legacy_loads), ("bytes json", json.loads)]
+    if ujson is not None:
+        backends.append(("bytes ujson", ujson.loads))
+    if orjson is not None:
+        backends.append(("bytes orjson", orjson.loads))
+
+    print("payloads: {} x {} bytes".format(args.payloads, len(body)))
+    baseline = None
+    for name, loads in backends:
+        elapsed = measure(loads, body, args.payloads, args.repeat, args.parse)
+        if baseline is None:
+            baseline = elapsed
+        print(
+            "{:14} {:8.1f} us/payload {:6.2f}x".format(
+                name + ":", elapsed / args.payloads * 1e6, baseline / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
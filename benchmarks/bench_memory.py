@@ -0,0 +1,93 @@
+"""
+Memory benchmark of SmhiForecast, measures the bytes allocated per
+forecast with tracemalloc for the slotted class and for the same class
+with a per instance __dict__. The forecasts are of the default
+parameters, so the extended values are left out of both.
+
+    python -m benchmarks.bench_memory --forecasts 100000
+"""
+
+import argparse
+import tracemalloc
+
+from datetime import datetime, timezone
+
+from smhi.smhi_lib import SmhiForecast
+
+
+# pylint: disable=R0902, R0903, R0913, R0914
+class DictSmhiForecast:
+    """SmhiForecast storage without slots, kept for comparison"""
+
+    def __init__(
+        self,
+        temperature,
+        temperature_max,
+        temperature_min,
+        humidity,
+        pressure,
+        thunder,
+        cloudiness,
+        precipitation,
+        wind_direction,
+        wind_speed,
+        horizontal_visibility,
+        wind_gust,
+        mean_precipitation,
+        total_precipitation,
+        symbol,
+        valid_time,
+    ) -> None:
+        self._temperature = temperature
+        self._temperature_max = temperature_max
+        self._temperature_min = temperature_min
+        self._humidity = humidity
+        self._pressure = pressure
+        self._thunder = thunder
+        self._cloudiness = cloudiness
+        self._precipitation = precipitation
+        self._mean_precipitation = mean_precipitation
+        self._total_precipitation = total_precipitation
+        self._wind_speed = wind_speed
+        self._wind_direction = wind_direction
+        self.horizontal_visibility = horizontal_visibility
+        self._wind_gust = wind_gust
+        self._symbol = symbol
+        self._valid_time = valid_time
+        self._extended = None
+
+
+def measure(forecast_class, count: int) -> float:
+    """Returns the bytes allocated per forecast"""
+    # Values are shared so only the forecast objects are measured
+    valid_time = datetime(2018, 9, 1, 15, tzinfo=timezone.utc)
+    args = (17, 17, 17, 55, 1024, 33, 50, 1, 134, 1.9, 50.0, 4.7, 0.1, 2.0, 1)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    forecasts = [forecast_class(*args, valid_time) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # The list holding them is not part of the forecast
+    list_size = forecasts.__sizeof__()
+    return (after - before - list_size) / count
+
+
+def main() -> None:
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--forecasts", type=int, default=100000)
+    args = parser.parse_args()
+
+    with_dict = measure(DictSmhiForecast, args.forecasts)
+    slotted = measure(SmhiForecast, args.forecasts)
+
+    print("forecasts: {}".format(args.forecasts))
+    print("with __dict__:  {:8.1f} bytes/forecast".format(with_dict))
+    print("__slots__:      {:8.1f} bytes/forecast".format(slotted))
+    print("saved:          {:8.1f}%".format(100 * (1 - slotted / with_dict)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark of _get_all_forecast_from_api against the if/elif parameter
+chain and strptime validTime parsing it replaced, using the 71 step
+fixture from test_smhi_lib scaled up to many payloads.
+
+    python -m benchmarks.bench_parse --payloads 2000
+"""
+
+import argparse
+import json
+import time
+
+from collections import OrderedDict
+from datetime import datetime
+
+from smhi.smhi_lib import SmhiForecast, _get_all_forecast_from_api
+from smhi.test_smhi_lib import FakeSmhiApi
+
+
+# pylint: disable=R0914, R0912, R0915
+def legacy_get_all_forecast_from_api(api_result: dict) -> OrderedDict:
+    """The if/elif and strptime parsing, kept for comparison"""
+    total_hours_last_forecast = 1.0
+    last_time = None
+    forecasts_ordered = OrderedDict()
+
+    for forecast in api_result["timeSeries"]:
+        valid_time = datetime.strptime(forecast["validTime"], "%Y-%m-%dT%H:%M:%SZ")
+        for param in forecast["parameters"]:
+            if param["name"] == "t":
+                temperature = float(param["values"][0])
+            elif param["name"] == "r":
+                humidity = int(param["values"][0])
+            elif param["name"] == "msl":
+                pressure = int(param["values"][0])
+            elif param["name"] == "tstm":
+                thunder = int(param["values"][0])
+            elif param["name"] == "tcc_mean":
+                octa = int(param["values"][0])
+                if 0 <= octa <= 8:
+                    cloudiness = round(100 * octa / 8)
+                else:
+                    cloudiness = 100
+            elif param["name"] == "Wsymb2":
+                symbol = int(param["values"][0])
+            elif param["name"] == "pcat":
+                precipitation = int(param["values"][0])
+            elif param["name"] == "pmean":
+                mean_precipitation = float(param["values"][0])
+            elif param["name"] == "ws":
+                wind_speed = float(param["values"][0])
+            elif param["name"] == "wd":
+                wind_direction = int(param["values"][0])
+            elif param["name"] == "vis":
+                horizontal_visibility = float(param["values"][0])
+            elif param["name"] == "gust":
+                wind_gust = float(param["values"][0])
+
+        rounded_temp = int(round(temperature))
+        if last_time is not None:
+            total_hours_last_forecast = (valid_time - last_time).seconds / 60 / 60
+        tp = round(mean_precipitation * total_hours_last_forecast, 2)
+
+        forecast = SmhiForecast(
+            rounded_temp,
+            rounded_temp,
+            rounded_temp,
+            humidity,
+            pressure,
+            thunder,
+            cloudiness,
+            precipitation,
+            wind_direction,
+            wind_speed,
+            horizontal_visibility,
+            wind_gust,
+            round(mean_precipitation, 1),
+            tp,
+            symbol,
+            valid_time,
+        )
+        forecasts_ordered.setdefault(valid_time.day, []).append(forecast)
+        last_time = valid_time
+
+    return forecasts_ordered
+
+
+def make_payloads(count: int) -> list:
+    """Returns count independent copies of the fixture payload"""
+    raw = json.dumps(FakeSmhiApi().get_forecast_api("", ""))
+    return [json.loads(raw) for _ in range(count)]
+
+
+def measure(parse, payloads: list, repeat: int) -> float:
+    """Returns the best time in seconds to parse all payloads"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            parse(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payloads", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.payloads)
+    legacy = measure(legacy_get_all_forecast_from_api, payloads, args.repeat)
+    table = measure(_get_all_forecast_from_api, payloads, args.repeat)
+
+    print(
+        "payloads: {} x {} steps".format(args.payloads, len(payloads[0]["timeSeries"]))
+    )
+    print("legacy parser:  {:8.1f} us/payload".format(legacy / args.payloads * 1e6))
+    print("current parser: {:8.1f} us/payload".format(table / args.payloads * 1e6))
+    print("speedup:        {:8.2f}x".format(legacy / table))
+
+
+if __name__ == "__main__":
+    main()
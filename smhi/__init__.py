@@ -1,8 +1,37 @@
 """intit.py"""
 
-from smhi.smhi_lib import Smhi, SmhiForecast, SmhiAPIBase
+import importlib
+
+from smhi.smhi_lib import Smhi, SmhiForecast, SmhiAPIBase, SmhiClientRegistry
+from smhi.smhi_lib import ALL_PARAMETERS, DEFAULT_PARAMETERS
+from smhi.smhi_cache import SmhiForecastCache, SmhiGridIndex
+from smhi.smhi_batch import SmhiBatch, SmhiBatchResult, SmhiThreadBatch
+from smhi.smhi_watcher import SmhiApprovedTimeWatcher
 
 __title__ = "SMHI"
 __version__ = "1.0.14"
 __author__ = "helto4real"
 __license__ = "MIT"
+
+# Imported on first use, they pull in NumPy, sqlite3 and mmap
+_LAZY_IMPORTS = {
+    "SmhiSqliteCache": "smhi.smhi_sqlite",
+    "ForecastFrame": "smhi.smhi_frame",
+    "SmhiMultipointAPI": "smhi.smhi_multipoint",
+    "SmhiMultipointGrid": "smhi.smhi_multipoint",
+    "SmhiForecastArchive": "smhi.smhi_archive",
+}
+
+
+def __getattr__(name: str):
+    """Imports the optional modules when their names are first used"""
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
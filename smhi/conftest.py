@@ -0,0 +1,19 @@
+"""
+Shared fixtures for the smhi tests
+"""
+
+import threading
+
+import pytest
+from smhi.smhi_testing import LocalServer
+
+
+@pytest.fixture
+def local_server() -> LocalServer:
+    """Runs a local http server for the duration of a test"""
+    server = LocalServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,258 @@
+"""
+Module smhi_archive contains the memory mapped binary archive of
+parsed forecasts, shared by the processes reading it
+"""
+
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from typing import Dict, Optional, Sequence, Tuple
+
+from smhi.smhi_cache import SmhiGridIndex
+from smhi.smhi_frame import ForecastFrame
+from smhi.smhi_multipoint import GRID_RADIUS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+ARCHIVE_MAGIC = b"SMHIARC\0"
+ARCHIVE_VERSION = 1
+
+# magic, version, byte order, points, steps, columns, approvedTime, the
+# header is 64 bytes so the sections after it stay 8 byte aligned
+_HEADER = struct.Struct("<8sHcxIII32s8x")
+
+# Each column name is a fixed width, NUL padded field
+_NAME = struct.Struct("32s")
+
+_BYTE_ORDERS = {"little": b"<", "big": b">"}
+
+
+class SmhiForecastArchive:
+    """
+    Read only archive of the forecasts of many points sharing valid times.
+
+    The file is a header, the column names, the coordinates, the valid
+    times and one packed (point, time) column of doubles per parameter,
+    missing values are NaN. It is memory mapped, so the views returned
+    are backed by the page cache and shared by every process reading
+    the same file. Columns are NumPy arrays when NumPy is installed, else
+    memoryviews, and are never copied.
+
+    A model run never changes once approved, write a new archive with
+    write_archive for the next one. Views keep the mapping open, close
+    only succeeds when they have been released.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Constructor, raises ValueError if the file is not an archive"""
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError("{} is too small to be an archive".format(path))
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._read_layout(path)
+        except ValueError:
+            self._mmap.close()
+            raise
+        self._index: Optional[SmhiGridIndex] = None
+        self._points_by_coordinate: Dict[Tuple[float, float], int] = {}
+
+    def __len__(self) -> int:
+        """Number of points"""
+        return self._points
+
+    def __enter__(self) -> "SmhiForecastArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def approved_time(self) -> Optional[str]:
+        """The approvedTime of the model run, None if not known"""
+        return self._approved_time
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """The names of the columns"""
+        return tuple(self._offsets)
+
+    @property
+    def coordinates(self):
+        """The (longitude, latitude) of each point as a (point, 2) view"""
+        return self._view(self._coordinates_offset, "d", (self._points, 2))
+
+    @property
+    def times(self):
+        """The valid times as seconds since epoch (UTC)"""
+        return self._view(self._times_offset, "q", (self._steps,))
+
+    def column(self, name: str):
+        """Returns a column as a (point, time) view"""
+        return self._view(self._column_offset(name), "d", (self._points, self._steps))
+
+    def frame(self, point: int) -> ForecastFrame:
+        """Returns the forecast of a point as a frame of views"""
+        if point < 0:
+            point += self._points
+        if not 0 <= point < self._points:
+            raise IndexError("SmhiForecastArchive index out of range")
+        row = point * self._steps * 8
+        return ForecastFrame(
+            self.times,
+            {
+                name: self._view(offset + row, "d", (self._steps,))
+                for name, offset in self._offsets.items()
+            },
+        )
+
+    def point(self, longitude: float, latitude: float) -> Optional[int]:
+        """Returns the index of the point closest to the coordinate, None
+        if there is none within the grid spacing"""
+        if self._index is None:
+            index = SmhiGridIndex(radius=GRID_RADIUS)
+            for point, (point_longitude, point_latitude) in enumerate(
+                self.coordinates.tolist()
+            ):
+                index.add(point_longitude, point_latitude)
+                self._points_by_coordinate[(point_longitude, point_latitude)] = point
+            self._index = index
+        grid_point = self._index.lookup(float(longitude), float(latitude))
+        if grid_point is None:
+            return None
+        return self._points_by_coordinate[grid_point]
+
+    def close(self) -> None:
+        """Closes the mapping, raises BufferError while views are in use"""
+        self._mmap.close()
+
+    def _read_layout(self, path: str) -> None:
+        """Reads the header and computes the offsets of the sections"""
+        (
+            magic,
+            version,
+            byte_order,
+            self._points,
+            self._steps,
+            columns,
+            approved_time,
+        ) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("{} is not a forecast archive".format(path))
+        if version != ARCHIVE_VERSION:
+            raise ValueError(
+                "{} has version {}, expected {}".format(path, version, ARCHIVE_VERSION)
+            )
+        if byte_order != _BYTE_ORDERS[sys.byteorder]:
+            raise ValueError("{} was written with another byte order".format(path))
+        self._approved_time = approved_time.rstrip(b"\0").decode("ascii") or None
+
+        offset = _HEADER.size
+        names = []
+        for _ in range(columns):
+            names.append(_NAME.unpack_from(self._mmap, offset)[0].rstrip(b"\0"))
+            offset += _NAME.size
+
+        self._coordinates_offset = offset
+        offset += self._points * 2 * 8
+        self._times_offset = offset
+        offset += self._steps * 8
+        self._offsets: Dict[str, int] = {}
+        for name in names:
+            self._offsets[name.decode("ascii")] = offset
+            offset += self._points * self._steps * 8
+        if offset != len(self._mmap):
+            raise ValueError(
+                "{} has {} bytes, expected {}".format(path, len(self._mmap), offset)
+            )
+
+    def _column_offset(self, name: str) -> int:
+        """Returns the offset of a column"""
+        try:
+            return self._offsets[name]
+        except KeyError:
+            raise KeyError("No column named {}".format(name)) from None
+
+    def _view(self, offset: int, typecode: str, shape: Tuple[int, ...]):
+        """Returns a view of the mapping, NumPy array if installed"""
+        count = 1
+        for length in shape:
+            count *= length
+        if np is not None:
+            return np.frombuffer(
+                self._mmap, dtype=typecode, count=count, offset=offset
+            ).reshape(shape)
+        view = memoryview(self._mmap)[offset : offset + count * 8]
+        return view.cast(typecode, shape)
+
+
+def write_archive(
+    path: str,
+    frames: Sequence[ForecastFrame],
+    coordinates: Sequence[Tuple[float, float]],
+    approved_time: Optional[str] = None,
+) -> None:
+    """
+    Writes the frames of the points at coordinates to an archive. The
+    frames must have the same valid times and columns. The archive is
+    written next to path and moved in place, so readers never see a
+    partly written file.
+    """
+    if len(frames) != len(coordinates):
+        raise ValueError(
+            "Got {} frames for {} coordinates".format(len(frames), len(coordinates))
+        )
+    times = _pack(frames[0].times if frames else (), "q")
+    names = frames[0].names if frames else ()
+    for frame in frames[1:]:
+        if frame.names != names or _pack(frame.times, "q") != times:
+            raise ValueError("All frames must have the same valid times and columns")
+
+    approved = (approved_time or "").encode("ascii")
+    if len(approved) > 32:
+        raise ValueError("approved_time is longer than 32 bytes")
+    for name in names:
+        if len(name.encode("ascii")) > _NAME.size:
+            raise ValueError("Column name {} is too long".format(name))
+
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(temporary, "wb") as file:
+            file.write(
+                _HEADER.pack(
+                    ARCHIVE_MAGIC,
+                    ARCHIVE_VERSION,
+                    _BYTE_ORDERS[sys.byteorder],
+                    len(frames),
+                    len(times) // 8,
+                    len(names),
+                    approved,
+                )
+            )
+            for name in names:
+                file.write(_NAME.pack(name.encode("ascii")))
+            file.write(_pack([value for point in coordinates for value in point], "d"))
+            file.write(times)
+            for name in names:
+                for frame in frames:
+                    file.write(_pack(frame.column(name), "d"))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _pack(values, typecode: str) -> bytes:
+    """Returns the values as packed bytes in the byte order of the host"""
+    if np is not None:
+        return np.ascontiguousarray(values, dtype=typecode).tobytes()
+    return array(typecode, values).tobytes()
@@ -0,0 +1,185 @@
+"""
+Module smhi_batch contains the code to get forecasts for
+many locations at once
+"""
+
+import asyncio
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from smhi.smhi_lib import (
+    SmhiAPI,
+    SmhiAPIBase,
+    SmhiForecast,
+    _get_parameters,
+    _round_coordinate,
+)
+
+
+class SmhiBatchResult:
+    """
+    Class to hold the result for one location in a batch, either the
+    forecasts or the error that stopped them from being fetched
+    """
+
+    def __init__(
+        self,
+        longitude: str,
+        latitude: str,
+        forecasts: Optional[List[SmhiForecast]] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """Constructor"""
+        self.longitude = longitude
+        self.latitude = latitude
+        self.forecasts = forecasts
+        self.error = error
+
+    @property
+    def coordinates(self) -> Tuple[str, str]:
+        """The rounded coordinates as (longitude, latitude)"""
+        return (self.longitude, self.latitude)
+
+    @property
+    def ok(self) -> bool:
+        """True if the forecasts were fetched"""
+        return self.error is None
+
+
+class SmhiBatch:
+    """
+    Fetches forecasts for many locations over one shared api, at most
+    limit locations are fetched at the same time.
+    """
+
+    def __init__(self, api: SmhiAPIBase = None, limit: int = 10) -> None:
+        """Constructor, without api one is created for the batch"""
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        if api is None:
+            api = SmhiAPI(pool_size=limit)
+        self._api = api
+        self._limit = limit
+
+    async def fetch_many(
+        self,
+        coordinates: Iterable[Tuple[str, str]],
+        parameters: Iterable[str] = None,
+        fields: Iterable[str] = None,
+    ) -> AsyncIterator[SmhiBatchResult]:
+        """
+        Yields the result for each unique (longitude, latitude) as soon as
+        it is done. Coordinates are unique after rounding. parameters and
+        fields selects what is decoded like for Smhi.async_get_forecast.
+        """
+        parameters = _get_parameters(parameters, fields)
+        semaphore = asyncio.Semaphore(self._limit)
+
+        async def fetch(longitude: str, latitude: str) -> SmhiBatchResult:
+            async with semaphore:
+                try:
+                    forecasts = await self._api.async_get_forecast(
+                        longitude, latitude, parameters
+                    )
+                except Exception as error:  # pylint: disable=W0703
+                    return SmhiBatchResult(longitude, latitude, error=error)
+                return SmhiBatchResult(longitude, latitude, forecasts)
+
+        async with self._api:
+            tasks = [
+                asyncio.ensure_future(fetch(longitude, latitude))
+                for longitude, latitude in _unique_coordinates(coordinates)
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SmhiThreadBatch:
+    """
+    Fetches forecasts for many locations in parallel from a thread pool,
+    for callers without an event loop. All threads share the connection
+    pool of the api. Close the batch, or use it as a context manager, to
+    close the api it created when none was given.
+    """
+
+    def __init__(
+        self,
+        api: SmhiAPIBase = None,
+        max_workers: int = 8,
+        executor: ThreadPoolExecutor = None,
+    ) -> None:
+        """Constructor, without executor one is created for each fetch"""
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self._owns_api = api is None
+        if api is None:
+            api = SmhiAPI(pool_size=max_workers)
+        self._api = api
+        self._max_workers = max_workers
+        self._executor = executor
+
+    def __enter__(self) -> "SmhiThreadBatch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the api if it was created by the batch"""
+        if self._owns_api:
+            self._api.close()
+
+    def fetch_many(
+        self,
+        coordinates: Iterable[Tuple[str, str]],
+        parameters: Iterable[str] = None,
+        fields: Iterable[str] = None,
+    ) -> Dict[Tuple[str, str], SmhiBatchResult]:
+        """
+        Returns the result for each unique (longitude, latitude), ordered as
+        the coordinates. Coordinates are unique after rounding. parameters
+        and fields selects what is decoded like for Smhi.get_forecast.
+        """
+        parameters = _get_parameters(parameters, fields)
+        executor = self._executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=self._max_workers)
+
+        try:
+            futures = [
+                (coordinate, executor.submit(self._fetch, *coordinate, parameters))
+                for coordinate in _unique_coordinates(coordinates)
+            ]
+            return OrderedDict(
+                (coordinate, future.result()) for coordinate, future in futures
+            )
+        finally:
+            if self._executor is None:
+                executor.shutdown(wait=True)
+
+    def _fetch(
+        self, longitude: str, latitude: str, parameters: FrozenSet[str]
+    ) -> SmhiBatchResult:
+        """Fetches the forecasts for one location"""
+        try:
+            forecasts = self._api.get_forecast(longitude, latitude, parameters)
+        except Exception as error:  # pylint: disable=W0703
+            return SmhiBatchResult(longitude, latitude, error=error)
+        return SmhiBatchResult(longitude, latitude, forecasts)
+
+
+def _unique_coordinates(
+    coordinates: Iterable[Tuple[str, str]],
+) -> List[Tuple[str, str]]:
+    """Returns the rounded coordinates without duplicates, in order"""
+    unique = OrderedDict()
+    for longitude, latitude in coordinates:
+        unique[(_round_coordinate(longitude), _round_coordinate(latitude))] = None
+    return list(unique)
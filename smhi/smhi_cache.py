@@ -0,0 +1,384 @@
+"""
+Module smhi_cache contains the in memory cache for forecasts
+fetched from the SMHI open API
+"""
+
+import math
+import threading
+import time
+
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from smhi.smhi_sqlite import SmhiSqliteCache
+
+# Approximate length in km of one degree of latitude and of one degree of
+# longitude at the equator
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON = 111.320
+
+
+class SmhiCacheEntry:
+    """
+    Class to hold a cached forecast, both the raw api result and
+    the forecasts parsed with the parameters
+    """
+
+    def __init__(
+        self,
+        json_data: dict,
+        forecasts: List,
+        stored_at: float,
+        parameters: Optional[FrozenSet[str]] = None,
+        coordinates: Optional[Tuple[str, str]] = None,
+    ) -> None:
+        """Constructor, coordinates are the ones the forecast was fetched for"""
+        self.json_data = json_data
+        self.forecasts = forecasts
+        self.stored_at = stored_at
+        self.parameters = parameters
+        self.coordinates = coordinates
+
+    @property
+    def approved_time(self) -> Optional[str]:
+        """The approvedTime of the model run the forecast is from"""
+        return self.json_data.get("approvedTime")
+
+
+class SmhiGridIndex:
+    """
+    Hashed grid of the SMHI grid points seen in api results.
+
+    The pmp3g grid has a spacing of about 2.5 km, so a known grid point
+    within half of that from a coordinate is the grid point closest to it.
+    Coordinates further away from every known point are only resolved if
+    the exact coordinate has been learned before.
+    """
+
+    def __init__(self, radius: float = 1.25, max_mappings: int = 65536) -> None:
+        """Constructor, radius is in km"""
+        if radius <= 0:
+            raise ValueError("radius must be positive")
+        self._radius = radius
+        self._max_mappings = max_mappings
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+        self._mappings: "OrderedDict[Tuple[float, float], Tuple[float, float]]" = (
+            OrderedDict()
+        )
+
+    @property
+    def radius(self) -> float:
+        """Max distance in km to a grid point for it to be used"""
+        return self._radius
+
+    def __len__(self) -> int:
+        return sum(len(points) for points in self._buckets.values())
+
+    def add(self, longitude: float, latitude: float) -> None:
+        """Adds a grid point"""
+        point = (longitude, latitude)
+        with self._lock:
+            points = self._buckets.setdefault(self._bucket(longitude, latitude), [])
+            if point not in points:
+                points.append(point)
+
+    def learn(
+        self,
+        longitude: float,
+        latitude: float,
+        grid_longitude: float,
+        grid_latitude: float,
+    ) -> None:
+        """Records that the coordinate was answered by the grid point"""
+        self.add(grid_longitude, grid_latitude)
+        with self._lock:
+            self._mappings[(longitude, latitude)] = (grid_longitude, grid_latitude)
+            self._mappings.move_to_end((longitude, latitude))
+            while len(self._mappings) > self._max_mappings:
+                self._mappings.popitem(last=False)
+
+    def lookup(
+        self, longitude: float, latitude: float
+    ) -> Optional[Tuple[float, float]]:
+        """Returns the grid point for the coordinate, None if not known"""
+        with self._lock:
+            point = self._mappings.get((longitude, latitude))
+            if point is not None:
+                return point
+
+            bucket_x, bucket_y = self._bucket(longitude, latitude)
+            km_per_lon = KM_PER_DEGREE_LON * math.cos(math.radians(latitude))
+            best = None
+            best_distance = self._radius
+            for x in range(bucket_x - 1, bucket_x + 2):
+                for y in range(bucket_y - 1, bucket_y + 2):
+                    for candidate in self._buckets.get((x, y), ()):
+                        distance = math.hypot(
+                            (candidate[0] - longitude) * km_per_lon,
+                            (candidate[1] - latitude) * KM_PER_DEGREE_LAT,
+                        )
+                        if distance <= best_distance:
+                            best = candidate
+                            best_distance = distance
+            return best
+
+    def _bucket(self, longitude: float, latitude: float) -> Tuple[int, int]:
+        """Returns the bucket, cells of radius km, for a coordinate"""
+        km_per_lon = KM_PER_DEGREE_LON * math.cos(math.radians(latitude))
+        return (
+            math.floor(longitude * km_per_lon / self._radius),
+            math.floor(latitude * KM_PER_DEGREE_LAT / self._radius),
+        )
+
+
+class SmhiForecastCache:
+    """
+    Thread safe LRU cache of forecasts keyed by the rounded coordinates.
+
+    Entries older than ttl seconds are not returned, and the least
+    recently used entries are evicted when there are more than
+    max_entries.
+
+    With a grid_index entries are keyed by the grid point the api
+    answered with, so any coordinate in an already fetched grid cell is
+    served from the cache.
+
+    With max_stale entries up to max_stale seconds past the ttl are
+    returned by get_stale, to be served while they are fetched again.
+
+    With a backend, such as SmhiSqliteCache, the api results are also
+    written to it, and entries missing in memory are loaded from it and
+    parsed again when used. Processes sharing the backend, or started
+    after it was written, then do not have to fetch the forecasts again.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 600.0,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+        grid_index: Optional[SmhiGridIndex] = None,
+        max_stale: float = 0.0,
+        backend: Optional["SmhiSqliteCache"] = None,
+    ) -> None:
+        """Constructor"""
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_stale < 0:
+            raise ValueError("max_stale must not be negative")
+        self._ttl = ttl
+        self._max_stale = max_stale
+        self._max_entries = max_entries
+        self._clock = clock
+        self._grid_index = grid_index
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, SmhiCacheEntry]" = OrderedDict()
+
+    @property
+    def ttl(self) -> float:
+        """Seconds an entry is considered fresh"""
+        return self._ttl
+
+    @property
+    def max_stale(self) -> float:
+        """Seconds past the ttl an entry can be served while refreshed"""
+        return self._max_stale
+
+    @property
+    def max_entries(self) -> int:
+        """Max number of entries before the least recently used is evicted"""
+        return self._max_entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def grid_index(self) -> Optional[SmhiGridIndex]:
+        """The grid index used to map coordinates to grid points"""
+        return self._grid_index
+
+    @property
+    def backend(self) -> Optional["SmhiSqliteCache"]:
+        """The cache the api results are also stored in"""
+        return self._backend
+
+    def get(self, longitude: str, latitude: str) -> Optional[SmhiCacheEntry]:
+        """Returns the entry for the coordinates if it is fresh"""
+        return self._get(longitude, latitude, self._ttl)
+
+    def get_stale(self, longitude: str, latitude: str) -> Optional[SmhiCacheEntry]:
+        """Returns the entry for the coordinates if it is fresh or at most
+        max_stale seconds past the ttl"""
+        return self._get(longitude, latitude, self._ttl + self._max_stale)
+
+    def peek(self, longitude: str, latitude: str) -> Optional[SmhiCacheEntry]:
+        """Returns the entry for the coordinates even if it is not fresh"""
+        key = self._key(longitude, latitude)
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(
+        self,
+        longitude: str,
+        latitude: str,
+        json_data: dict,
+        forecasts: List,
+        parameters: Optional[FrozenSet[str]] = None,
+        stored_at: Optional[float] = None,
+    ) -> SmhiCacheEntry:
+        """Stores a forecast for the coordinates, parameters are the ones
+        the forecasts was parsed with. stored_at is now if None."""
+        if stored_at is None:
+            stored_at = self._clock()
+        entry, previous = self._insert(
+            longitude, latitude, json_data, forecasts, parameters, stored_at
+        )
+        # The api result is already in the backend when only the forecasts
+        # was parsed again
+        if self._backend is not None and (
+            previous is None
+            or previous.json_data is not json_data
+            or previous.stored_at != stored_at
+        ):
+            self._backend.put(
+                longitude,
+                latitude,
+                json_data,
+                self._backend.now() - (self._clock() - stored_at),
+            )
+        return entry
+
+    def warm_start(self, limit: Optional[int] = None) -> int:
+        """Loads the most recently used api results of the backend, at most
+        limit or max_entries, and returns the number loaded. They are parsed
+        when first used."""
+        if self._backend is None:
+            return 0
+        if limit is None or limit > self._max_entries:
+            limit = self._max_entries
+        rows = list(self._backend.load(limit))
+        now = self._clock()
+        backend_now = self._backend.now()
+        # Least recently used first so they are evicted first
+        for longitude, latitude, json_data, stored_at in reversed(rows):
+            self._insert(
+                longitude,
+                latitude,
+                json_data,
+                None,
+                None,
+                now - (backend_now - stored_at),
+            )
+        return len(rows)
+
+    def invalidate(self, longitude: str, latitude: str) -> None:
+        """Removes the entry for the coordinates"""
+        key = self._key(longitude, latitude)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._backend is not None:
+            self._backend.invalidate(longitude, latitude)
+
+    def invalidate_older(self, approved_time: str) -> List[SmhiCacheEntry]:
+        """Removes the entries from model runs approved before approved_time
+        and returns them"""
+        with self._lock:
+            older = [
+                key
+                for key, entry in self._entries.items()
+                if entry.approved_time is not None
+                and entry.approved_time < approved_time
+            ]
+            removed = [self._entries.pop(key) for key in older]
+        if self._backend is not None:
+            self._backend.invalidate_older(approved_time)
+        return removed
+
+    def clear(self) -> None:
+        """Removes all entries"""
+        with self._lock:
+            self._entries.clear()
+        if self._backend is not None:
+            self._backend.clear()
+
+    def _get(
+        self, longitude: str, latitude: str, max_age: float
+    ) -> Optional[SmhiCacheEntry]:
+        """Returns the entry for the coordinates if it is at most max_age
+        seconds old, loaded from the backend if not in memory"""
+        key = self._key(longitude, latitude)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry.stored_at <= max_age:
+                self._entries.move_to_end(key)
+                return entry
+        if self._backend is None:
+            return None
+
+        # Another process may have stored a newer one
+        result = self._backend.get(longitude, latitude)
+        if result is None:
+            return None
+        json_data, stored_at = result
+        age = self._backend.now() - stored_at
+        if age > max_age:
+            return None
+        entry, _ = self._insert(
+            longitude, latitude, json_data, None, None, self._clock() - age
+        )
+        return entry
+
+    def _insert(
+        self,
+        longitude: str,
+        latitude: str,
+        json_data: dict,
+        forecasts: Optional[List],
+        parameters: Optional[FrozenSet[str]],
+        stored_at: float,
+    ) -> Tuple[SmhiCacheEntry, Optional[SmhiCacheEntry]]:
+        """Stores an entry in memory, returns it and the one it replaced"""
+        key = (longitude, latitude)
+        grid_point = _get_grid_point(json_data)
+        if self._grid_index is not None and grid_point is not None:
+            self._grid_index.learn(float(longitude), float(latitude), *grid_point)
+            key = grid_point
+        entry = SmhiCacheEntry(
+            json_data, forecasts, stored_at, parameters, (longitude, latitude)
+        )
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return entry, previous
+
+    def _key(self, longitude: str, latitude: str) -> Hashable:
+        """Returns the key of the entry for the coordinates"""
+        if self._grid_index is not None:
+            grid_point = self._grid_index.lookup(float(longitude), float(latitude))
+            if grid_point is not None:
+                return grid_point
+        return (longitude, latitude)
+
+
+def _get_grid_point(json_data: dict) -> Optional[Tuple[float, float]]:
+    """Returns the grid point the api result is for"""
+    try:
+        longitude, latitude = json_data["geometry"]["coordinates"][0]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    return (float(longitude), float(latitude))
@@ -0,0 +1,321 @@
+"""
+Module smhi_frame contains a columnar representation of the
+forecast timeseries from the SMHI open API
+"""
+
+import math
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from smhi.smhi_lib import (
+    ALL_PARAMETERS,
+    SmhiForecast,
+    _PARAMETERS,
+    _PARAMETER_DECODERS,
+    _SmhiTimeStepDecoder,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# The columns of a frame, the decoded parameters and the total
+# precipitation since the timestep before
+FRAME_COLUMNS: Tuple[str, ...] = tuple(field for _, field, _ in _PARAMETERS) + (
+    "total_precipitation",
+)
+
+SECONDS_PER_DAY = 86400
+
+# Columns holding whole numbers, converted back to int for SmhiForecast
+_INT_COLUMNS = frozenset(
+    field for _, field, converter in _PARAMETERS if converter is not float
+)
+
+
+class ForecastFrame:
+    """
+    Struct of arrays view of a forecast timeseries, one column per
+    parameter and the valid times as epoch seconds.
+
+    Columns are NumPy arrays when NumPy is installed, else memoryviews of
+    array.array. Column access and slicing never copies the data, and
+    SmhiForecast objects are only created when asked for.
+    """
+
+    def __init__(self, times: Sequence[int], columns: Dict[str, Sequence[float]]):
+        """Constructor"""
+        for name, column in columns.items():
+            if len(column) != len(times):
+                raise ValueError(
+                    "Column {} has {} values, expected {}".format(
+                        name, len(column), len(times)
+                    )
+                )
+        self._times = times
+        self._columns = columns
+
+    @classmethod
+    def from_api(cls, api_result: dict) -> "ForecastFrame":
+        """Creates a frame from the API result"""
+        return _get_frame_from_api(api_result)
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def __getitem__(self, index: int) -> SmhiForecast:
+        """Returns the forecast of one timestep"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ForecastFrame index out of range")
+        return self._get_forecast(index)
+
+    def __iter__(self) -> Iterator[SmhiForecast]:
+        return self.forecasts()
+
+    @property
+    def times(self) -> Sequence[int]:
+        """The valid times as seconds since epoch (UTC)"""
+        return self._times
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """The names of the columns"""
+        return tuple(self._columns)
+
+    def column(self, name: str) -> Sequence[float]:
+        """Returns a column, without copying it"""
+        try:
+            return self._columns[name]
+        except KeyError:
+            raise KeyError("No column named {}".format(name)) from None
+
+    def between(self, start: datetime, end: datetime) -> "ForecastFrame":
+        """Returns the timesteps valid from start up to, not including, end,
+        without copying the data"""
+        first = bisect_left(self._times, _to_epoch(start))
+        last = bisect_left(self._times, _to_epoch(end))
+        return ForecastFrame(
+            self._times[first:last],
+            {name: column[first:last] for name, column in self._columns.items()},
+        )
+
+    def forecasts(self) -> Iterator[SmhiForecast]:
+        """Yields a forecast for each timestep, created when needed"""
+        for index in range(len(self)):
+            yield self._get_forecast(index)
+
+    def _get_forecast(self, index: int) -> SmhiForecast:
+        """Creates the forecast of one timestep like _get_all_forecast_from_api"""
+        values = {}
+        for name, column in self._columns.items():
+            value = float(column[index])
+            if math.isnan(value):
+                value = None
+            elif name in _INT_COLUMNS:
+                value = int(value)
+            values[name] = value
+
+        temperature = values.get("temperature")
+        if temperature is not None:
+            temperature = int(round(temperature))
+        mean_precipitation = values.get("mean_precipitation")
+        if mean_precipitation is not None:
+            mean_precipitation = round(mean_precipitation, 1)
+
+        return SmhiForecast(
+            temperature,
+            temperature,
+            temperature,
+            values.get("humidity"),
+            values.get("pressure"),
+            values.get("thunder"),
+            values.get("cloudiness"),
+            values.get("precipitation"),
+            values.get("wind_direction"),
+            values.get("wind_speed"),
+            values.get("horizontal_visibility"),
+            values.get("wind_gust"),
+            mean_precipitation,
+            values.get("total_precipitation"),
+            values.get("symbol"),
+            datetime.fromtimestamp(int(self._times[index]), timezone.utc),
+            precipitation_min=values.get("precipitation_min"),
+            precipitation_max=values.get("precipitation_max"),
+            precipitation_median=values.get("precipitation_median"),
+            frozen_precipitation=values.get("frozen_precipitation"),
+            low_cloudiness=values.get("low_cloudiness"),
+            medium_cloudiness=values.get("medium_cloudiness"),
+            high_cloudiness=values.get("high_cloudiness"),
+        )
+
+
+def _to_epoch(value: datetime) -> int:
+    """Returns a datetime as seconds since epoch, naive ones are UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return math.ceil(value.timestamp())
+
+
+def _get_frame_from_api(api_result: dict) -> ForecastFrame:
+    """Converts results from API to a ForecastFrame, the columnar
+    counterpart of _get_all_forecast_from_api"""
+    times = array("q")
+    columns = {name: array("d") for name in FRAME_COLUMNS}
+    appends = [columns[field].append for _, field, _ in _PARAMETERS]
+    append_total_precipitation = columns["total_precipitation"].append
+    mean_precipitation_index = _PARAMETER_DECODERS["pmean"][0]
+
+    # Parameters missing in the api result are NaN in the columns
+    step = _SmhiTimeStepDecoder(ALL_PARAMETERS, missing=math.nan).step
+
+    for forecast in api_result["timeSeries"]:
+        valid_time, values, total_hours_last_forecast = step(forecast)
+
+        for append, value in zip(appends, values):
+            append(value)
+
+        # Total precipitation, have to calculate with the nr of
+        # hours since last forecast to get correct total value
+        append_total_precipitation(
+            round(values[mean_precipitation_index] * total_hours_last_forecast, 2)
+        )
+        times.append(int(valid_time.timestamp()))
+
+    if np is not None:
+        return ForecastFrame(
+            np.frombuffer(times, dtype=np.int64),
+            {
+                name: np.frombuffer(column, dtype=np.float64)
+                for name, column in columns.items()
+            },
+        )
+    return ForecastFrame(
+        memoryview(times),
+        {name: memoryview(column) for name, column in columns.items()},
+    )
+
+
+# pylint: disable=R0903
+class SmhiDailyAggregate:
+    """
+    Class to hold the daily values of many locations, as arrays indexed
+    by (location, day), computed by aggregate_daily
+    """
+
+    def __init__(
+        self,
+        days: Sequence[int],
+        temperature_max,
+        temperature_min,
+        total_precipitation,
+        mean_precipitation,
+    ) -> None:
+        """Constructor"""
+        self.days = days
+        self.temperature_max = temperature_max
+        self.temperature_min = temperature_min
+        self.total_precipitation = total_precipitation
+        self.mean_precipitation = mean_precipitation
+
+
+def aggregate_daily(
+    times: Sequence[int], temperature, mean_precipitation
+) -> SmhiDailyAggregate:
+    """
+    Vectorized daily min/max temperature and precipitation totals for
+    many locations sharing the same valid times.
+
+    temperature and mean_precipitation are (location, time) arrays of the
+    values from the API. The results are bit for bit the same as the daily
+    forecasts from _get_forecast, days are the UTC days as seconds since
+    epoch.
+    """
+    if np is None:
+        raise ImportError("numpy is required for aggregate_daily")
+
+    times = np.asarray(times, dtype=np.int64)
+    temperature = np.atleast_2d(np.asarray(temperature, dtype=np.float64))
+    mean_precipitation = np.atleast_2d(np.asarray(mean_precipitation, dtype=np.float64))
+    if temperature.shape != mean_precipitation.shape or temperature.shape[1:] != (
+        len(times),
+    ):
+        raise ValueError("Expected (location, time) arrays matching the times")
+
+    # Hours since the timestep before, like timedelta.seconds the whole
+    # days are dropped, the first timestep counts as one hour
+    hours = np.empty(len(times), dtype=np.float64)
+    hours[:1] = 1.0
+    hours[1:] = (np.diff(times) % SECONDS_PER_DAY) / 60 / 60
+    total_precipitation = _round_like_python(mean_precipitation * hours, 2)
+
+    days, starts = np.unique(times // SECONDS_PER_DAY, return_index=True)
+    ends = np.append(starts[1:], len(times))
+    rounded_temperature = np.rint(temperature)
+
+    # The scalar path starts from -100/100, max and min are exact in any order
+    temperature_max = np.maximum(
+        np.maximum.reduceat(rounded_temperature, starts, axis=1), -100.0
+    )
+    temperature_min = np.minimum(
+        np.minimum.reduceat(rounded_temperature, starts, axis=1), 100.0
+    )
+
+    # Sums are accumulated in time order from 0.0 like the scalar path,
+    # a pairwise sum could differ in the last bits
+    daily_precipitation = np.empty(temperature_max.shape, dtype=np.float64)
+    zeros = np.zeros((temperature.shape[0], 1), dtype=np.float64)
+    for day, (start, end) in enumerate(zip(starts, ends)):
+        daily_precipitation[:, day] = np.add.accumulate(
+            np.concatenate((zeros, total_precipitation[:, start:end]), axis=1),
+            axis=1,
+        )[:, -1]
+
+    return SmhiDailyAggregate(
+        days * SECONDS_PER_DAY,
+        temperature_max,
+        temperature_min,
+        daily_precipitation,
+        daily_precipitation / 24,
+    )
+
+
+def aggregate_daily_frames(frames: List[ForecastFrame]) -> SmhiDailyAggregate:
+    """Vectorized daily values for frames of many locations, all the frames
+    must have the same valid times"""
+    if np is None:
+        raise ImportError("numpy is required for aggregate_daily_frames")
+    if not frames:
+        raise ValueError("At least one frame is needed")
+
+    times = np.asarray(frames[0].times, dtype=np.int64)
+    for frame in frames[1:]:
+        if not np.array_equal(np.asarray(frame.times, dtype=np.int64), times):
+            raise ValueError("All frames must have the same valid times")
+
+    return aggregate_daily(
+        times,
+        np.vstack([np.asarray(frame.column("temperature")) for frame in frames]),
+        np.vstack([np.asarray(frame.column("mean_precipitation")) for frame in frames]),
+    )
+
+
+def _round_like_python(values, ndigits: int):
+    """
+    Vectorized round(value, ndigits) that gives the same floats as the
+    builtin. Python rounds the exact decimal value, which only differs
+    from rounding the scaled float when that lands next to a half, those
+    few values are rounded with the builtin.
+    """
+    scale = 10.0**ndigits
+    scaled = values * scale
+    rounded = np.rint(scaled) / scale
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for index in zip(*np.nonzero(near_half)):
+        rounded[index] = round(float(values[index]), ndigits)
+    return rounded
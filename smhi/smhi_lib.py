@@ -4,20 +4,86 @@ the Swedish weather institute (SMHI) through the open
 API:s
 """
 import abc
+import asyncio
 import aiohttp
-import copy
 import json
+import threading
 
 from collections import OrderedDict
-from datetime import datetime
-from urllib.request import urlopen
-from typing import List
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from smhi.smhi_cache import SmhiCacheEntry, SmhiForecastCache
+from smhi.smhi_stream import SmhiTimeSeriesParser
+from smhi.smhi_transport import (
+    CHUNK_SIZE,
+    SmhiConnectionPool,
+    SmhiContentDecoder,
+    SmhiTransferStats,
+)
 
 APIURL_TEMPLATE = (
     "https://opendata-download-metfcst.smhi.se/api/category"
     "/pmp3g/version/2/geotype/point/lon/{}/lat/{}/data.json"
 )
 
+APPROVED_TIME_URL = (
+    "https://opendata-download-metfcst.smhi.se/api/category"
+    "/pmp3g/version/2/approvedtime.json"
+)
+
+# Guards the creation of the in flight maps of the apis
+_INFLIGHT_LOCK = threading.Lock()
+
+# Max number of urls whose validators are remembered for conditional requests
+MAX_CONDITIONAL_URLS = 256
+
+# Decodes an api result from the bytes received, orjson if installed
+if orjson is None:
+    JSON_LOADS: Callable[[bytes], dict] = json.loads
+else:
+    JSON_LOADS = orjson.loads
+
+# The API parameters decoded if not asked for others
+DEFAULT_PARAMETERS = frozenset(
+    (
+        "t",
+        "r",
+        "msl",
+        "tstm",
+        "tcc_mean",
+        "Wsymb2",
+        "pcat",
+        "pmean",
+        "ws",
+        "wd",
+        "vis",
+        "gust",
+    )
+)
+
+# Every API parameter that can be decoded, the default ones and the
+# extended precipitation and cloud layer parameters
+ALL_PARAMETERS = DEFAULT_PARAMETERS | frozenset(
+    ("pmin", "pmax", "pmedian", "spp", "lcc_mean", "mcc_mean", "hcc_mean")
+)
+
 
 class SmhiForecastException(Exception):
     """Exception thrown if failing to access API"""
@@ -25,11 +91,36 @@ class SmhiForecastException(Exception):
     pass
 
 
+# The extended values of a forecast without them
+_NO_EXTENDED = (None,) * 7
+
+
 class SmhiForecast:
     """
     Class to hold forecast data
     """
 
+    # Slots keeps the per instance memory down when holding many forecasts
+    __slots__ = (
+        "_temperature",
+        "_temperature_max",
+        "_temperature_min",
+        "_humidity",
+        "_pressure",
+        "_thunder",
+        "_cloudiness",
+        "_precipitation",
+        "_mean_precipitation",
+        "_total_precipitation",
+        "_wind_speed",
+        "_wind_direction",
+        "horizontal_visibility",
+        "_wind_gust",
+        "_symbol",
+        "_valid_time",
+        "_extended",
+    )
+
     # pylint: disable=R0913, R0902, R0914
     def __init__(
         self,
@@ -49,8 +140,18 @@ class SmhiForecast:
         total_precipitation: float,
         symbol: int,
         valid_time: datetime,
+        *,
+        precipitation_min: float = None,
+        precipitation_max: float = None,
+        precipitation_median: float = None,
+        frozen_precipitation: int = None,
+        low_cloudiness: int = None,
+        medium_cloudiness: int = None,
+        high_cloudiness: int = None,
     ) -> None:
-        """Constructor"""
+        """Constructor, the keyword only values are from the extended
+        parameters and None unless asked for. They share one slot that is
+        None when all of them are, so the default forecasts stay small"""
         self._temperature = temperature
         self._temperature_max = temperature_max
         self._temperature_min = temperature_min
@@ -67,6 +168,16 @@ class SmhiForecast:
         self._wind_gust = wind_gust
         self._symbol = symbol
         self._valid_time = valid_time
+        extended = (
+            precipitation_min,
+            precipitation_max,
+            precipitation_median,
+            frozen_precipitation,
+            low_cloudiness,
+            medium_cloudiness,
+            high_cloudiness,
+        )
+        self._extended = None if extended == _NO_EXTENDED else extended
 
     @property
     def temperature(self) -> int:
@@ -178,6 +289,48 @@ class SmhiForecast:
         """Valid time"""
         return self._valid_time
 
+    @property
+    def precipitation_min(self) -> float:
+        """Minimum precipitation intensity (mm/h)"""
+        return self._get_extended(0)
+
+    @property
+    def precipitation_max(self) -> float:
+        """Maximum precipitation intensity (mm/h)"""
+        return self._get_extended(1)
+
+    @property
+    def precipitation_median(self) -> float:
+        """Median precipitation intensity (mm/h)"""
+        return self._get_extended(2)
+
+    @property
+    def frozen_precipitation(self) -> int:
+        """Percent of precipitation in frozen form, -9 if no precipitation"""
+        return self._get_extended(3)
+
+    @property
+    def low_cloudiness(self) -> int:
+        """Low level cloud cover 0-100 %"""
+        return self._get_extended(4)
+
+    @property
+    def medium_cloudiness(self) -> int:
+        """Medium level cloud cover 0-100 %"""
+        return self._get_extended(5)
+
+    @property
+    def high_cloudiness(self) -> int:
+        """High level cloud cover 0-100 %"""
+        return self._get_extended(6)
+
+    def _get_extended(self, index: int):
+        """Returns a value of the extended parameters, None if not decoded"""
+        extended = self._extended
+        if extended is None:
+            return None
+        return extended[index]
+
 
 # pylint: disable=R0903
 
@@ -186,8 +339,202 @@ class SmhiAPIBase:
     """
     Baseclass to use as dependecy incjection pattern for easier
     automatic testing
+
+    Set cache to a SmhiForecastCache to reuse both the api result and
+    the parsed forecasts for the same coordinates
+
+    parameters selects the API parameters decoded, DEFAULT_PARAMETERS
+    if None. Any of ALL_PARAMETERS can be asked for.
+
+    If the cache has a max_stale, async_get_forecast returns a forecast
+    that is no longer fresh at once and fetches it again in the
+    background. on_refresh is called with the coordinates and the
+    forecasts each time async_get_forecast has fetched a forecast.
     """
 
+    cache: Optional[SmhiForecastCache] = None
+    on_refresh: Optional[Callable[[str, str, List[SmhiForecast]], None]] = None
+
+    # (event loop, longitude, latitude, parameters) -> task fetching the
+    # forecasts, created on first use as subclasses need not call __init__
+    _inflight: Optional[Dict[tuple, asyncio.Future]] = None
+
+    @property
+    def inflight(self) -> int:
+        """Number of forecasts being fetched asyncronious"""
+        return len(self._get_inflight())
+
+    def get_forecast(
+        self, longitude: str, latitude: str, parameters: Iterable[str] = None
+    ) -> List[SmhiForecast]:
+        """Returns the parsed forecasts, from the cache if possible"""
+        parameters = _get_parameters(parameters)
+        cached = self._get_cached_forecast(longitude, latitude, parameters)
+        if cached is not None:
+            return cached
+
+        json_data = self.get_forecast_api(longitude, latitude)
+        return self._store_forecast(longitude, latitude, json_data, parameters)
+
+    async def async_get_forecast(
+        self, longitude: str, latitude: str, parameters: Iterable[str] = None
+    ) -> List[SmhiForecast]:
+        """Returns the parsed forecasts asyncronious, from the cache if possible
+
+        Concurrent calls for the same coordinates share one api call
+        """
+        parameters = _get_parameters(parameters)
+        cached = self._get_cached_forecast(longitude, latitude, parameters)
+        if cached is not None:
+            return cached
+
+        stale = self._get_stale_forecast(longitude, latitude, parameters)
+        task = self._get_fetch_task(longitude, latitude, parameters)
+        if stale is not None:
+            # The task refreshes the cache in the background
+            return stale
+
+        # Shielded so a cancelled caller does not cancel the others
+        forecasts = await asyncio.shield(task)
+        return list(forecasts)
+
+    def _get_fetch_task(
+        self, longitude: str, latitude: str, parameters: FrozenSet[str]
+    ) -> asyncio.Future:
+        """Returns the task fetching the forecasts, shared by concurrent calls"""
+        # Futures are bound to a loop so calls are only shared per loop
+        inflight = self._get_inflight()
+        key = (asyncio.get_running_loop(), longitude, latitude, parameters)
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._async_fetch_forecast(longitude, latitude, parameters)
+            )
+            inflight[key] = task
+
+            def done(_) -> None:
+                inflight.pop(key, None)
+                # A background refresh may have no caller to raise to
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(done)
+        return task
+
+    def _get_inflight(self) -> Dict[tuple, asyncio.Future]:
+        """Returns the tasks fetching forecasts, shared by all loops"""
+        if self._inflight is None:
+            with _INFLIGHT_LOCK:
+                if self._inflight is None:
+                    self._inflight = {}
+        return self._inflight
+
+    async def _async_fetch_forecast(
+        self, longitude: str, latitude: str, parameters: FrozenSet[str]
+    ) -> List[SmhiForecast]:
+        """Calls the api and parses the result"""
+        json_data = await self.async_get_forecast_api(longitude, latitude)
+        forecasts = self._store_forecast(longitude, latitude, json_data, parameters)
+        if self.on_refresh is not None:
+            self.on_refresh(longitude, latitude, list(forecasts))
+        return forecasts
+
+    def _get_cached_forecast(
+        self, longitude: str, latitude: str, parameters: FrozenSet[str]
+    ) -> Optional[List[SmhiForecast]]:
+        """Returns the forecasts from the cache, None if not cached. A
+        cached api result parsed with other parameters is parsed again"""
+        if self.cache is None:
+            return None
+        entry = self.cache.get(longitude, latitude)
+        if entry is None:
+            return None
+        if entry.parameters != parameters:
+            # Stored as old as the api result it is parsed from
+            forecasts = _get_forecast(entry.json_data, parameters)
+            self.cache.put(
+                longitude,
+                latitude,
+                entry.json_data,
+                forecasts,
+                parameters,
+                entry.stored_at,
+            )
+            return list(forecasts)
+        return list(entry.forecasts)
+
+    def _get_stale_forecast(
+        self, longitude: str, latitude: str, parameters: FrozenSet[str]
+    ) -> Optional[List[SmhiForecast]]:
+        """Returns the forecasts from a cached entry that is no longer
+        fresh but within max_stale, None if there is none"""
+        if self.cache is None or not self.cache.max_stale:
+            return None
+        entry = self.cache.get_stale(longitude, latitude)
+        if entry is None:
+            return None
+        if entry.parameters != parameters:
+            return _get_forecast(entry.json_data, parameters)
+        return list(entry.forecasts)
+
+    def _store_forecast(
+        self,
+        longitude: str,
+        latitude: str,
+        json_data: dict,
+        parameters: FrozenSet[str] = DEFAULT_PARAMETERS,
+    ) -> List[SmhiForecast]:
+        """Parses the api result and stores it in the cache"""
+        if self.cache is None:
+            return _get_forecast(json_data, parameters)
+
+        # The api returns the same result object when the forecast was
+        # not modified, the forecasts parsed from it can then be reused
+        previous = self.cache.peek(longitude, latitude)
+        if (
+            previous is not None
+            and previous.json_data is json_data
+            and previous.parameters == parameters
+        ):
+            forecasts = previous.forecasts
+        else:
+            forecasts = _get_forecast(json_data, parameters)
+        self.cache.put(longitude, latitude, json_data, forecasts, parameters)
+        return list(forecasts)
+
+    def stream_forecast(
+        self, longitude: str, latitude: str, parameters: Iterable[str] = None
+    ) -> Iterator[SmhiForecast]:
+        """Yields the forecast of each timestep as it is received. These are
+        the hourly forecasts, without daily summaries, and the cache is not
+        used"""
+        decode = _SmhiTimeStepDecoder(_get_parameters(parameters)).decode
+        for entry in self.stream_forecast_api(longitude, latitude):
+            yield decode(entry)
+
+    async def async_stream_forecast(
+        self, longitude: str, latitude: str, parameters: Iterable[str] = None
+    ) -> AsyncIterator[SmhiForecast]:
+        """Yields the forecast of each timestep as it is received
+        asyncronious, like stream_forecast"""
+        decode = _SmhiTimeStepDecoder(_get_parameters(parameters)).decode
+        async for entry in self.async_stream_forecast_api(longitude, latitude):
+            yield decode(entry)
+
+    def stream_forecast_api(self, longitude: str, latitude: str) -> Iterator[dict]:
+        """Yields the timeSeries entries of the api result, override to
+        decode them while the result is received"""
+        yield from self.get_forecast_api(longitude, latitude)["timeSeries"]
+
+    async def async_stream_forecast_api(
+        self, longitude: str, latitude: str
+    ) -> AsyncIterator[dict]:
+        """Yields the timeSeries entries of the api result asyncronious,
+        override to decode them while the result is received"""
+        json_data = await self.async_get_forecast_api(longitude, latitude)
+        for entry in json_data["timeSeries"]:
+            yield entry
+
     @abc.abstractmethod
     def get_forecast_api(self, longitude: str, latitude: str) -> {}:
         """Override this"""
@@ -202,51 +549,369 @@ class SmhiAPIBase:
             "users must define get_forecast to use this base class"
         )
 
+    def invalidate_older(self, approved_time: str) -> List[SmhiCacheEntry]:
+        """Removes the cached forecasts from model runs approved before
+        approved_time and returns them, override if the api keeps more"""
+        if self.cache is None:
+            return []
+        return self.cache.invalidate_older(approved_time)
 
-# pylint: disable=R0903
+    def close(self) -> None:
+        """Releases resources held by the api, override if needed"""
+
+    async def async_close(self) -> None:
+        """Releases resources held by the api asyncronious, override if needed"""
+
+    async def __aenter__(self) -> "SmhiAPIBase":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+# pylint: disable=R0903, R0902
 
 
 class SmhiAPI(SmhiAPIBase):
-    """Default implementation for SMHI api"""
+    """Default implementation for SMHI api
 
-    def __init__(self) -> None:
-        """Init the API with or without session"""
+    Use it with async with to let it own one aiohttp session, and its
+    connection pool, for the lifetime of the block. Sessions are owned
+    per event loop so one instance can be shared by tasks and threads
+    running different loops. Outside of a block each async call uses a
+    short lived session unless one is provided.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        pool_size: int = 10,
+        idle_timeout: float = 30.0,
+        connector_limit: int = 100,
+        dns_cache_ttl: int = 300,
+        cache: Optional[SmhiForecastCache] = None,
+        conditional_requests: bool = True,
+        compression: bool = True,
+        loads: Callable[[bytes], dict] = None,
+    ) -> None:
+        """Init the API with or without session
+
+        pool_size and idle_timeout configures the keep-alive connections
+        used by both the syncronious calls and the owned aiohttp session,
+        connector_limit and dns_cache_ttl only applies to the latter.
+        With conditional_requests and a cache the ETag and Last-Modified of
+        the latest results are remembered, and a not modified result is
+        answered from the cache.
+        With compression the responses are transfered compressed, the
+        bytes received and decoded are counted in stats.
+        loads decodes the json from the bytes received, JSON_LOADS if None,
+        e.g. ujson.loads.
+        """
         self.session = None
+        self.cache = cache
+        self._loads = loads or JSON_LOADS
+        self._conditional_requests = conditional_requests
+        # Url -> (etag, last modified, approvedTime of the result)
+        self._validators: "OrderedDict[str, tuple]" = OrderedDict()
+        self.pool = SmhiConnectionPool(
+            pool_size=pool_size, idle_timeout=idle_timeout, compression=compression
+        )
+        self._connector_limit = connector_limit
+        self._dns_cache_ttl = dns_cache_ttl
+        self._lock = threading.Lock()
+        # Event loop -> [owned session, number of users]
+        self._owned_sessions: Dict[asyncio.AbstractEventLoop, list] = {}
+
+    @property
+    def stats(self) -> SmhiTransferStats:
+        """Byte counters for both the syncronious and asyncronious calls"""
+        return self.pool.stats
 
     def get_forecast_api(self, longitude: str, latitude: str) -> {}:
         """gets data from API"""
         api_url = APIURL_TEMPLATE.format(longitude, latitude)
 
-        response = urlopen(api_url)
-        data = response.read().decode("utf-8")
-        json_data = json.loads(data)
+        headers, previous = self._conditional_headers(api_url, longitude, latitude)
+        response = self.pool.request(api_url, headers)
+        if response.status == 304:
+            return _not_modified(previous)
+        _check_status(response.status)
+        json_data = self._loads(response.body)
+        self._remember_validators(api_url, response.headers, json_data)
 
         return json_data
 
+    def stream_forecast_api(self, longitude: str, latitude: str) -> Iterator[dict]:
+        """Yields the timeSeries entries from the API as they are received,
+        only the entry being received is kept in memory. Streamed requests
+        are not conditional."""
+        api_url = APIURL_TEMPLATE.format(longitude, latitude)
+        parser = SmhiTimeSeriesParser(self._loads)
+
+        with self.pool.stream(api_url) as response:
+            _check_status(response.status)
+            for chunk in response.iter_chunks():
+                yield from parser.feed(chunk)
+        parser.close()
+
+    def close(self) -> None:
+        """Closes the pooled connections"""
+        self.pool.close()
+
+    async def async_close(self) -> None:
+        """Closes the session owned for the running loop and the pooled
+        connections"""
+        with self._lock:
+            owned = self._owned_sessions.pop(asyncio.get_running_loop(), None)
+        if owned is not None and owned[0] is not None:
+            await owned[0].close()
+        self.close()
+
+    async def __aenter__(self) -> "SmhiAPI":
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            owned = self._owned_sessions.setdefault(loop, [None, 0])
+            owned[1] += 1
+        if owned[0] is None and self.session is None:
+            owned[0] = self._create_session()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            owned = self._owned_sessions.get(loop)
+            if owned is None:
+                return
+            owned[1] -= 1
+            if owned[1] > 0:
+                return
+            del self._owned_sessions[loop]
+        if owned[0] is not None:
+            await owned[0].close()
+
+    def _get_session(self) -> Optional[aiohttp.ClientSession]:
+        """Returns the provided session or the one owned for the running loop"""
+        if self.session is not None:
+            return self.session
+        owned = self._owned_sessions.get(asyncio.get_running_loop())
+        if owned is None:
+            return None
+        return owned[0]
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Creates a session with a connector tuned for the SMHI api"""
+        connector = aiohttp.TCPConnector(
+            limit=self._connector_limit,
+            limit_per_host=self.pool.pool_size,
+            ttl_dns_cache=self._dns_cache_ttl,
+            keepalive_timeout=self.pool.idle_timeout,
+        )
+        # Responses are decoded by us so the received bytes can be counted
+        return aiohttp.ClientSession(connector=connector, auto_decompress=False)
+
     async def async_get_forecast_api(self, longitude: str, latitude: str) -> {}:
         """gets data from API asyncronious"""
         api_url = APIURL_TEMPLATE.format(longitude, latitude)
 
-        is_new_session = False
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-            is_new_session = True
+        session = self._get_session()
+        temporary_session = None
+        if session is None:
+            session = temporary_session = self._create_session()
+
+        headers, previous = self._conditional_headers(api_url, longitude, latitude)
+        headers["Accept-Encoding"] = self.pool.accept_encoding
+
+        try:
+            async with session.get(api_url, headers=headers) as response:
+                if response.status == 304:
+                    return _not_modified(previous)
+                _check_status(response.status)
+                data = b"".join(
+                    [chunk async for chunk in self._async_iter_body(session, response)]
+                )
+                headers = response.headers
+        finally:
+            if temporary_session is not None:
+                await temporary_session.close()
 
+        json_data = self._loads(data)
+        self._remember_validators(api_url, headers, json_data)
 
-        async with self.session.get(api_url) as response:
-            if response.status != 200:
-                if is_new_session:
-                    await self.session.close()
-                raise SmhiForecastException(
-                    "Failed to access weather API with status code {}".format(
-                        response.status
-                    )
-                )
-            data = await response.text()
-            if is_new_session:
-               await self.session.close()
+        return json_data
+
+    async def async_stream_forecast_api(
+        self, longitude: str, latitude: str
+    ) -> AsyncIterator[dict]:
+        """Yields the timeSeries entries from the API asyncronious as they
+        are received, only the entry being received is kept in memory.
+        Streamed requests are not conditional."""
+        api_url = APIURL_TEMPLATE.format(longitude, latitude)
+        parser = SmhiTimeSeriesParser(self._loads)
+
+        session = self._get_session()
+        temporary_session = None
+        if session is None:
+            session = temporary_session = self._create_session()
+
+        headers = {"Accept-Encoding": self.pool.accept_encoding}
+        try:
+            async with session.get(api_url, headers=headers) as response:
+                _check_status(response.status)
+                async for chunk in self._async_iter_body(session, response):
+                    for entry in parser.feed(chunk):
+                        yield entry
+        finally:
+            if temporary_session is not None:
+                await temporary_session.close()
+        parser.close()
+
+    def get_approved_time_api(self) -> dict:
+        """gets the approvedTime and referenceTime of the latest model run"""
+        return self._get_json(APPROVED_TIME_URL)
+
+    async def async_get_approved_time_api(self) -> dict:
+        """gets the approvedTime and referenceTime of the latest model run
+        asyncronious"""
+        session = self._get_session()
+        temporary_session = None
+        if session is None:
+            session = temporary_session = self._create_session()
+        try:
+            return await self._async_get_json(session, APPROVED_TIME_URL)
+        finally:
+            if temporary_session is not None:
+                await temporary_session.close()
+
+    def _get_json(self, url: str) -> dict:
+        """Gets and decodes a resource"""
+        response = self.pool.request(url)
+        _check_status(response.status)
+        return self._loads(response.body)
+
+    async def _async_get_json(self, session: aiohttp.ClientSession, url: str) -> dict:
+        """Gets and decodes a resource asyncronious"""
+        headers = {"Accept-Encoding": self.pool.accept_encoding}
+        async with session.get(url, headers=headers) as response:
+            _check_status(response.status)
+            data = b"".join(
+                [chunk async for chunk in self._async_iter_body(session, response)]
+            )
+        return self._loads(data)
+
+    async def _async_iter_body(
+        self, session: aiohttp.ClientSession, response: aiohttp.ClientResponse
+    ) -> AsyncIterator[bytes]:
+        """Yields the decoded response body in chunks as they are received"""
+        received = 0
+        decoded = 0
+        if session.auto_decompress:
+            # A provided session that decodes by itself, only the decoded
+            # size is known
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                received += len(chunk)
+                yield chunk
+            self.stats.record(received, received)
+            return
+
+        decoder = SmhiContentDecoder(response.headers.get("Content-Encoding"))
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            received += len(chunk)
+            chunk = decoder.decompress(chunk)
+            decoded += len(chunk)
+            yield chunk
+        chunk = decoder.flush()
+        decoded += len(chunk)
+        self.stats.record(received, decoded)
+        yield chunk
+
+    def _conditional_headers(
+        self, api_url: str, longitude: str, latitude: str
+    ) -> Tuple[Dict[str, str], Optional[dict]]:
+        """Returns the headers that makes a request conditional and the
+        cached result they validate, no headers if it is not cached"""
+        if self.cache is None:
+            return {}, None
+        with self._lock:
+            validators = self._validators.get(api_url)
+            if validators is not None:
+                self._validators.move_to_end(api_url)
+        if validators is None:
+            return {}, None
+        etag, last_modified, approved_time = validators
+        previous = self.cache.peek(longitude, latitude)
+        if previous is None or previous.approved_time != approved_time:
+            return {}, None
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers, previous.json_data
+
+    def _remember_validators(self, api_url: str, headers, json_data: dict) -> None:
+        """Remembers ETag and Last-Modified for the result of api_url, only
+        the approvedTime is kept as the result itself is in the cache"""
+        if not self._conditional_requests or self.cache is None:
+            return
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        with self._lock:
+            if not etag and not last_modified:
+                self._validators.pop(api_url, None)
+                return
+            self._validators[api_url] = (
+                etag,
+                last_modified,
+                json_data.get("approvedTime"),
+            )
+            self._validators.move_to_end(api_url)
+            while len(self._validators) > MAX_CONDITIONAL_URLS:
+                self._validators.popitem(last=False)
+
+
+class SmhiClientRegistry:
+    """
+    Registry of named api clients that Smhi objects can share. Clients
+    are created by the factory on first use.
+    """
 
-            return json.loads(data)
+    def __init__(self, factory: Callable[[], SmhiAPIBase] = SmhiAPI) -> None:
+        """Constructor"""
+        self._factory = factory
+        self._clients: Dict[str, SmhiAPIBase] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str = "default") -> SmhiAPIBase:
+        """Returns the client registered with name, creates it if missing"""
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._factory()
+                self._clients[name] = client
+            return client
+
+    def register(self, name: str, api: SmhiAPIBase) -> None:
+        """Registers api as the client with name"""
+        with self._lock:
+            self._clients[name] = api
+
+    def close(self) -> None:
+        """Closes all clients"""
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.close()
+
+    async def async_close(self) -> None:
+        """Closes all clients asyncronious"""
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            await client.async_close()
+
+
+# The clients used by Smhi objects created without an api
+CLIENTS = SmhiClientRegistry()
 
 
 class Smhi:
@@ -260,42 +925,145 @@ class Smhi:
         longitude: str,
         latitude: str,
         session: aiohttp.ClientSession = None,
-        api: SmhiAPIBase = SmhiAPI(),
+        api: SmhiAPIBase = None,
     ) -> None:
-        self._longitude = str(round(float(longitude), 6))
-        self._latitude = str(round(float(latitude), 6))
+        """
+        Without api the shared default client from CLIENTS is used. A
+        session given without api gets a client of its own so the shared
+        one is never rebound.
+        """
+        self._longitude = _round_coordinate(longitude)
+        self._latitude = _round_coordinate(latitude)
+
+        if api is None:
+            if session:
+                api = SmhiAPI()
+            else:
+                api = CLIENTS.get()
         self._api = api
 
         if session:
             self._api.session = session
 
-    def get_forecast(self) -> List[SmhiForecast]:
+    async def __aenter__(self) -> "Smhi":
+        await self._api.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._api.__aexit__(*exc_info)
+
+    def get_forecast(
+        self, parameters: Iterable[str] = None, fields: Iterable[str] = None
+    ) -> List[SmhiForecast]:
         """
         Returns a list of forecasts. The first in list are the current one
+
+        parameters are the API parameters to decode, DEFAULT_PARAMETERS if
+        None, e.g. ALL_PARAMETERS for the extended ones as well. Or give
+        the SmhiForecast fields needed, e.g. ("temperature", "symbol"),
+        and the other fields are None.
         """
-        json_data = self._api.get_forecast_api(self._longitude, self._latitude)
-        return _get_forecast(json_data)
+        return self._api.get_forecast(
+            self._longitude, self._latitude, _get_parameters(parameters, fields)
+        )
 
-    async def async_get_forecast(self) -> List[SmhiForecast]:
+    async def async_get_forecast(
+        self, parameters: Iterable[str] = None, fields: Iterable[str] = None
+    ) -> List[SmhiForecast]:
         """
         Returns a list of forecasts. The first in list are the current one
+
+        parameters are the API parameters to decode, DEFAULT_PARAMETERS if
+        None, e.g. ALL_PARAMETERS for the extended ones as well. Or give
+        the SmhiForecast fields needed, e.g. ("temperature", "symbol"),
+        and the other fields are None.
         """
-        json_data = await self._api.async_get_forecast_api(
-            self._longitude, self._latitude
+        return await self._api.async_get_forecast(
+            self._longitude, self._latitude, _get_parameters(parameters, fields)
         )
-        return _get_forecast(json_data)
+
+    def stream_forecast(
+        self, parameters: Iterable[str] = None, fields: Iterable[str] = None
+    ) -> Iterator[SmhiForecast]:
+        """
+        Yields the hourly forecast of each timestep, in order, as soon as it
+        is received. parameters and fields as for get_forecast.
+        """
+        return self._api.stream_forecast(
+            self._longitude, self._latitude, _get_parameters(parameters, fields)
+        )
+
+    def async_stream_forecast(
+        self, parameters: Iterable[str] = None, fields: Iterable[str] = None
+    ) -> AsyncIterator[SmhiForecast]:
+        """
+        Yields the hourly forecast of each timestep asyncronious, in order,
+        as soon as it is received. parameters and fields as for get_forecast.
+        """
+        return self._api.async_stream_forecast(
+            self._longitude, self._latitude, _get_parameters(parameters, fields)
+        )
+
+
+def _not_modified(previous: Optional[dict]) -> dict:
+    """Returns the cached result a not modified response refers to"""
+    if previous is None:
+        raise SmhiForecastException(
+            "Weather API returned not modified for an unknown forecast"
+        )
+    return previous
+
+
+def _check_status(status: int) -> None:
+    """Raises SmhiForecastException if the status is not 200 OK"""
+    if status != 200:
+        raise SmhiForecastException(
+            "Failed to access weather API with status code {}".format(status)
+        )
+
+
+def _round_coordinate(value: str) -> str:
+    """Rounds a coordinate to the max six decimals the api allows"""
+    return str(round(float(value), 6))
+
+
+def _get_parameters(
+    parameters: Optional[Iterable[str]], fields: Optional[Iterable[str]] = None
+) -> FrozenSet[str]:
+    """Returns the parameters to decode, the ones needed for the
+    SmhiForecast fields if given, else DEFAULT_PARAMETERS if None"""
+    if fields is not None:
+        if parameters is not None:
+            raise ValueError("Use either parameters or fields, not both")
+        fields = frozenset(fields)
+        unknown = fields - _FIELD_PARAMETERS.keys()
+        if unknown:
+            raise ValueError("Unknown fields {}".format(", ".join(sorted(unknown))))
+        parameters = {_FIELD_PARAMETERS[field] for field in fields} - {None}
+    if parameters is None:
+        return DEFAULT_PARAMETERS
+    parameters = frozenset(parameters)
+    unknown = parameters - ALL_PARAMETERS
+    if unknown:
+        raise ValueError("Unknown parameters {}".format(", ".join(sorted(unknown))))
+    return parameters
 
 
 # pylint: disable=R0914, R0912, W0212, R0915
-def _get_forecast(api_result: dict) -> List[SmhiForecast]:
+def _get_forecast(
+    api_result: dict, parameters: FrozenSet[str] = DEFAULT_PARAMETERS
+) -> List[SmhiForecast]:
     """Converts results fråm API to SmhiForeCast list"""
-    forecasts = []
-
     # Need the ordered dict to get
     # the days in order in next stage
-    forecasts_ordered = OrderedDict()
+    forecasts_ordered = _get_all_forecast_from_api(api_result, parameters)
 
-    forecasts_ordered = _get_all_forecast_from_api(api_result)
+    return _get_daily_forecasts(forecasts_ordered)
+
+
+def _get_daily_forecasts(forecasts_ordered: OrderedDict) -> List[SmhiForecast]:
+    """Summarizes the forecasts of each day, the current one first"""
+    forecasts = []
 
     # Used to calc the daycount
     day_nr = 1
@@ -305,7 +1073,7 @@ def _get_forecast(api_result: dict) -> List[SmhiForecast]:
 
         if day_nr == 1:
             # Add the most recent forecast
-            forecasts.append(copy.deepcopy(forecasts_day[0]))
+            forecasts.append(forecasts_day[0])
 
         total_precipitation = float(0.0)
         forecast_temp_max = -100.0
@@ -313,89 +1081,258 @@ def _get_forecast(api_result: dict) -> List[SmhiForecast]:
         forecast = None
         for forcast_day in forecasts_day:
             temperature = forcast_day.temperature
-            if forecast_temp_min > temperature:
-                forecast_temp_min = temperature
-            if forecast_temp_max < temperature:
-                forecast_temp_max = temperature
+            if temperature is not None:
+                if forecast_temp_min > temperature:
+                    forecast_temp_min = temperature
+                if forecast_temp_max < temperature:
+                    forecast_temp_max = temperature
 
             if forcast_day.valid_time.hour == 12:
-                forecast = copy.deepcopy(forcast_day)
+                forecast = forcast_day
 
-            total_precipitation = total_precipitation + forcast_day._total_precipitation
+            if forcast_day._total_precipitation is not None:
+                total_precipitation = (
+                    total_precipitation + forcast_day._total_precipitation
+                )
 
         if forecast is None:
             # We passed 12 noon, set to current
             forecast = forecasts_day[0]
 
-        forecast._temperature_max = forecast_temp_max
-        forecast._temperature_min = forecast_temp_min
-        forecast._total_precipitation = total_precipitation
-        forecast._mean_precipitation = total_precipitation / 24
-        forecasts.append(forecast)
+        # Not decoded if the parameters was left out
+        if forecasts_day[0].temperature is None:
+            forecast_temp_max = forecast_temp_min = None
+        if forecasts_day[0]._total_precipitation is None:
+            total_precipitation = None
+
+        forecasts.append(
+            _get_daily_summary(
+                forecast, forecast_temp_max, forecast_temp_min, total_precipitation
+            )
+        )
         day_nr = day_nr + 1
 
     return forecasts
 
 
-# pylint: disable=R0914, R0912, W0212, R0915
+def _get_daily_summary(
+    forecast: SmhiForecast,
+    temperature_max: float,
+    temperature_min: float,
+    total_precipitation: Optional[float],
+) -> SmhiForecast:
+    """Returns a new forecast with the values of the day, the forecast
+    itself is left untouched"""
+    mean_precipitation = None
+    if total_precipitation is not None:
+        mean_precipitation = total_precipitation / 24
+    summary = SmhiForecast(
+        forecast._temperature,
+        temperature_max,
+        temperature_min,
+        forecast._humidity,
+        forecast._pressure,
+        forecast._thunder,
+        forecast._cloudiness,
+        forecast._precipitation,
+        forecast._wind_direction,
+        forecast._wind_speed,
+        forecast.horizontal_visibility,
+        forecast._wind_gust,
+        mean_precipitation,
+        total_precipitation,
+        forecast._symbol,
+        forecast._valid_time,
+    )
+    summary._extended = forecast._extended
+    return summary
+
+
+@lru_cache(maxsize=4096)
+def _parse_valid_time(value: str) -> datetime:
+    """
+    Parses a validTime like 2018-09-01T15:00:00Z to a UTC datetime. All
+    locations of a model run shares the same times so they are memoized.
+    """
+    if len(value) == 20 and value[4] == "-" and value[10] == "T" and value[19] == "Z":
+        return datetime(
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[11:13]),
+            int(value[14:16]),
+            int(value[17:19]),
+            tzinfo=timezone.utc,
+        )
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+def _octas_to_percent(value: int) -> int:
+    """Converts cloudiness in octas to percent"""
+    octa = int(value)
+    if 0 <= octa <= 8:  # Between 0 -> 8
+        return round(100 * octa / 8)  # Convert octas to percent
+    return 100  # If not determined use 100%
+
+
+# The parameters used from the API as (name, field, converter), in the
+# order _get_all_forecast_from_api unpacks them
+_PARAMETERS = (
+    ("t", "temperature", float),  # Celcius
+    ("r", "humidity", int),  # Percent
+    ("msl", "pressure", int),  # hPa
+    ("tstm", "thunder", int),  # Percent
+    ("tcc_mean", "cloudiness", _octas_to_percent),  # Octas to percent
+    ("Wsymb2", "symbol", int),  # category
+    ("pcat", "precipitation", int),  # percipitation
+    ("pmean", "mean_precipitation", float),  # mean_percipitation
+    ("ws", "wind_speed", float),  # wind speed
+    ("wd", "wind_direction", int),  # wind direction
+    ("vis", "horizontal_visibility", float),  # Visibility
+    ("gust", "wind_gust", float),  # wind gust speed
+    ("pmin", "precipitation_min", float),  # min percipitation
+    ("pmax", "precipitation_max", float),  # max percipitation
+    ("pmedian", "precipitation_median", float),  # median percipitation
+    ("spp", "frozen_precipitation", int),  # Percent, -9 if no percipitation
+    ("lcc_mean", "low_cloudiness", _octas_to_percent),  # Octas to percent
+    ("mcc_mean", "medium_cloudiness", _octas_to_percent),  # Octas to percent
+    ("hcc_mean", "high_cloudiness", _octas_to_percent),  # Octas to percent
+)
 
+# Parameter name -> (index of the value, converter), any other
+# parameter in the API result is skipped
+_PARAMETER_DECODERS = {
+    name: (index, converter) for index, (name, _, converter) in enumerate(_PARAMETERS)
+}
 
-def _get_all_forecast_from_api(api_result: dict) -> OrderedDict:
-    """Converts results fråm API to SmhiForeCast list"""
-    # Total time in hours since last forecast
-    total_hours_last_forecast = 1.0
 
-    # Last forecast time
-    last_time = None
+# SmhiForecast field -> the parameter it is from, None if from none
+_FIELD_PARAMETERS = {field: name for name, field, _ in _PARAMETERS}
+_FIELD_PARAMETERS.update(
+    temperature_max="t",
+    temperature_min="t",
+    total_precipitation="pmean",
+    valid_time=None,
+)
+
+
+@lru_cache(maxsize=64)
+def _get_decoders(parameters: FrozenSet[str]) -> Dict[str, Tuple[int, Callable]]:
+    """Returns the decoders of the parameters, the others are skipped
+    without being converted"""
+    return {
+        name: decoder
+        for name, decoder in _PARAMETER_DECODERS.items()
+        if name in parameters
+    }
+
+
+# pylint: disable=R0914, R0912, W0212, R0915
 
+
+def _get_all_forecast_from_api(
+    api_result: dict, parameters: FrozenSet[str] = DEFAULT_PARAMETERS
+) -> OrderedDict:
+    """Converts results fråm API to SmhiForeCast list"""
     # Need the ordered dict to get
     # the days in order in next stage
     forecasts_ordered = OrderedDict()
+    decode = _SmhiTimeStepDecoder(parameters).decode
 
-    # Get the parameters
     for forecast in api_result["timeSeries"]:
+        forecast = decode(forecast)
+        day = forecast._valid_time.day
+
+        if day not in forecasts_ordered:
+            # add a new list
+            forecasts_ordered[day] = []
+
+        forecasts_ordered[day].append(forecast)
+
+    return forecasts_ordered
+
+
+class _SmhiTimeStepDecoder:
+    """
+    Converts the timeSeries entries of an api result to SmhiForecast, one
+    at a time and in order
+    """
+
+    __slots__ = ("_decoders", "_values", "_last_time")
+
+    def __init__(
+        self, parameters: FrozenSet[str] = DEFAULT_PARAMETERS, missing=None
+    ) -> None:
+        """Constructor, missing is the value of parameters not decoded"""
+        self._decoders = _get_decoders(parameters)
+
+        # The decoded parameters, a parameter missing in a timestep
+        # keeps the value from the one before
+        self._values = [missing] * len(_PARAMETERS)
+
+        # Last forecast time
+        self._last_time = None
+
+    def step(self, forecast: dict) -> Tuple[datetime, List, float]:
+        """
+        Decodes the next timeSeries entry, returns its valid time, the
+        values of _PARAMETERS in order and the hours since the entry
+        before. The values are updated in place by the next step.
+        """
+        values = self._values
+        decoders = self._decoders
 
-        valid_time = datetime.strptime(forecast["validTime"], "%Y-%m-%dT%H:%M:%SZ")
+        valid_time = _parse_valid_time(forecast["validTime"])
         for param in forecast["parameters"]:
-            if param["name"] == "t":
-                temperature = float(param["values"][0])  # Celcisus
-            elif param["name"] == "r":
-                humidity = int(param["values"][0])  # Percent
-            elif param["name"] == "msl":
-                pressure = int(param["values"][0])  # hPa
-            elif param["name"] == "tstm":
-                thunder = int(param["values"][0])  # Percent
-            elif param["name"] == "tcc_mean":
-                octa = int(param["values"][0])  # Cloudiness in octas
-                if 0 <= octa <= 8:  # Between 0 -> 8
-                    cloudiness = round(100 * octa / 8)  # Convert octas to percent
-                else:
-                    cloudiness = 100  # If not determined use 100%
-            elif param["name"] == "Wsymb2":
-                symbol = int(param["values"][0])  # category
-            elif param["name"] == "pcat":
-                precipitation = int(param["values"][0])  # percipitation
-            elif param["name"] == "pmean":
-                mean_precipitation = float(param["values"][0])  # mean_percipitation
-            elif param["name"] == "ws":
-                wind_speed = float(param["values"][0])  # wind speed
-            elif param["name"] == "wd":
-                wind_direction = int(param["values"][0])  # wind direction
-            elif param["name"] == "vis":
-                horizontal_visibility = float(param["values"][0])  # Visibility
-            elif param["name"] == "gust":
-                wind_gust = float(param["values"][0])  # wind gust speed
-
-        roundedTemp = int(round(temperature))
-
-        if last_time is not None:
-            total_hours_last_forecast = (valid_time - last_time).seconds / 60 / 60
+            decoder = decoders.get(param["name"])
+            if decoder is not None:
+                values[decoder[0]] = decoder[1](param["values"][0])
+
+        # Total time in hours since last forecast
+        total_hours_last_forecast = 1.0
+        if self._last_time is not None:
+            total_hours_last_forecast = (valid_time - self._last_time).seconds / 60 / 60
+        self._last_time = valid_time
+
+        return valid_time, values, total_hours_last_forecast
+
+    def decode(self, forecast: dict) -> SmhiForecast:
+        """Returns the forecast of the next timeSeries entry"""
+        valid_time, values, total_hours_last_forecast = self.step(forecast)
+        (
+            temperature,
+            humidity,
+            pressure,
+            thunder,
+            cloudiness,
+            symbol,
+            precipitation,
+            mean_precipitation,
+            wind_speed,
+            wind_direction,
+            horizontal_visibility,
+            wind_gust,
+            precipitation_min,
+            precipitation_max,
+            precipitation_median,
+            frozen_precipitation,
+            low_cloudiness,
+            medium_cloudiness,
+            high_cloudiness,
+        ) = values
+
+        roundedTemp = None
+        if temperature is not None:
+            roundedTemp = int(round(temperature))
 
         # Total precipitation, have to calculate with the nr of
         # hours since last forecast to get correct total value
-        tp = round(mean_precipitation * total_hours_last_forecast, 2)
+        tp = None
+        if mean_precipitation is not None:
+            tp = round(mean_precipitation * total_hours_last_forecast, 2)
+            mean_precipitation = round(mean_precipitation, 1)
 
-        forecast = SmhiForecast(
+        return SmhiForecast(
             roundedTemp,
             roundedTemp,
             roundedTemp,
@@ -408,18 +1345,15 @@ def _get_all_forecast_from_api(api_result: dict) -> OrderedDict:
             wind_speed,
             horizontal_visibility,
             wind_gust,
-            round(mean_precipitation, 1),
+            mean_precipitation,
             tp,
             symbol,
             valid_time,
+            precipitation_min=precipitation_min,
+            precipitation_max=precipitation_max,
+            precipitation_median=precipitation_median,
+            frozen_precipitation=frozen_precipitation,
+            low_cloudiness=low_cloudiness,
+            medium_cloudiness=medium_cloudiness,
+            high_cloudiness=high_cloudiness,
         )
-
-        if valid_time.day not in forecasts_ordered:
-            # add a new list
-            forecasts_ordered[valid_time.day] = []
-
-        forecasts_ordered[valid_time.day].append(forecast)
-
-        last_time = valid_time
-
-    return forecasts_ordered
@@ -0,0 +1,352 @@
+"""
+Module smhi_multipoint contains the code to get forecasts for every
+grid point at once from the multipoint SMHI open API
+"""
+
+import asyncio
+import math
+import threading
+import time
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from smhi.smhi_cache import SmhiCacheEntry, SmhiForecastCache, SmhiGridIndex
+from smhi.smhi_lib import (
+    SmhiAPI,
+    SmhiAPIBase,
+    SmhiForecastException,
+    _get_parameters,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+MULTIPOINT_URL = (
+    "https://opendata-download-metfcst.smhi.se/api/category"
+    "/pmp3g/version/2/geotype/multipoint"
+)
+
+# Path of the grid of one parameter at one valid time
+_DATA_PATH = "/validtime/{}/parameter/{}/leveltype/{}/level/{}/data.json?with-geo=false"
+
+# Level type and level of the parameters that are not at height above
+# ground 0, msl is at mean sea level
+_LEVELS = {
+    "msl": ("hmsl", 0),
+    "t": ("hl", 2),
+    "r": ("hl", 2),
+    "vis": ("hl", 2),
+    "ws": ("hl", 10),
+    "wd": ("hl", 10),
+    "gust": ("hl", 10),
+}
+_DEFAULT_LEVEL = ("hl", 0)
+
+# Seconds a grid is used when there is no cache to take the ttl from
+DEFAULT_GRID_TTL = 600.0
+
+# Distance in km within which the closest grid point answers a
+# coordinate, enough to cover the diagonal of the 2.5 km grid
+GRID_RADIUS = 2.5
+
+
+class SmhiMultipointGrid:
+    """
+    Dense forecast of every grid point, one array per parameter indexed
+    by (valid time, grid point). Values missing in the api results are NaN.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        coordinates: Sequence[Tuple[float, float]],
+        valid_times: Sequence[str],
+        values: Dict[str, array],
+        approved_time: Optional[str] = None,
+        reference_time: Optional[str] = None,
+    ) -> None:
+        """Constructor, values are flat arrays in row major order"""
+        size = len(coordinates) * len(valid_times)
+        for name, column in values.items():
+            if len(column) != size:
+                raise ValueError(
+                    "Parameter {} has {} values, expected {}".format(
+                        name, len(column), size
+                    )
+                )
+        self.coordinates = coordinates
+        self.valid_times = valid_times
+        self.approved_time = approved_time
+        self.reference_time = reference_time
+        self._values = values
+        self._index = SmhiGridIndex(radius=GRID_RADIUS)
+        self._points = {}
+        for point, (longitude, latitude) in enumerate(coordinates):
+            self._index.add(longitude, latitude)
+            self._points[(longitude, latitude)] = point
+
+    def __len__(self) -> int:
+        """Number of grid points"""
+        return len(self.coordinates)
+
+    @property
+    def parameters(self) -> Tuple[str, ...]:
+        """The parameters of the grid"""
+        return tuple(self._values)
+
+    def values(self, parameter: str):
+        """Returns the values of a parameter as a (valid time, grid point)
+        NumPy array, or memoryview without NumPy, without copying them"""
+        try:
+            column = self._values[parameter]
+        except KeyError:
+            raise KeyError("No parameter named {}".format(parameter)) from None
+        shape = (len(self.valid_times), len(self.coordinates))
+        if np is not None:
+            return np.frombuffer(column, dtype=np.float64).reshape(shape)
+        return memoryview(column).cast("B").cast("d", shape)
+
+    def point(self, longitude: float, latitude: float) -> Optional[int]:
+        """Returns the index of the grid point closest to the coordinate,
+        None if it is outside the grid"""
+        grid_point = self._index.lookup(float(longitude), float(latitude))
+        if grid_point is None:
+            return None
+        return self._points[grid_point]
+
+    def get_api_result(self, point: int) -> dict:
+        """Returns the forecast of a grid point as the point api result"""
+        count = len(self.coordinates)
+        time_series = []
+        for time_index, valid_time in enumerate(self.valid_times):
+            parameters = []
+            for name, column in self._values.items():
+                value = column[time_index * count + point]
+                if not math.isnan(value):
+                    parameters.append({"name": name, "values": [value]})
+            time_series.append({"validTime": valid_time, "parameters": parameters})
+
+        return {
+            "approvedTime": self.approved_time,
+            "referenceTime": self.reference_time,
+            "geometry": {
+                "type": "Point",
+                "coordinates": [list(self.coordinates[point])],
+            },
+            "timeSeries": time_series,
+        }
+
+
+class SmhiMultipointAPI(SmhiAPI):
+    """
+    Api that fetches the forecast of every grid point, one request per
+    parameter and valid time, and answers the point forecasts from it.
+
+    The grid is fetched on the first forecast asked for, or by fetch and
+    async_fetch. It is fetched again when it is older than grid_ttl, the
+    ttl of the cache if None, or after invalidate_older with a newer
+    approvedTime, e.g. from SmhiApprovedTimeWatcher. Concurrent calls
+    share one fetch of the grid. Coordinates outside the grid raises
+    SmhiForecastException.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        parameters: Iterable[str] = None,
+        pool_size: int = 10,
+        idle_timeout: float = 30.0,
+        cache: Optional[SmhiForecastCache] = None,
+        compression: bool = True,
+        loads: Callable[[bytes], dict] = None,
+        grid_ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Init the API, parameters are the ones fetched for the grid,
+        DEFAULT_PARAMETERS if None"""
+        super().__init__(
+            pool_size=pool_size,
+            idle_timeout=idle_timeout,
+            cache=cache,
+            conditional_requests=False,
+            compression=compression,
+            loads=loads,
+        )
+        self._parameters = sorted(_get_parameters(parameters))
+        self.grid: Optional[SmhiMultipointGrid] = None
+        if grid_ttl is None:
+            grid_ttl = cache.ttl if cache is not None else DEFAULT_GRID_TTL
+        self._grid_ttl = grid_ttl
+        self._clock = clock
+        self._fetched_at = 0.0
+        self._grid_lock = threading.Lock()
+        # Event loop -> task fetching the grid
+        self._grid_tasks: Dict[asyncio.AbstractEventLoop, asyncio.Future] = {}
+
+    # The point forecasts are answered from the whole grid
+    stream_forecast_api = SmhiAPIBase.stream_forecast_api
+    async_stream_forecast_api = SmhiAPIBase.async_stream_forecast_api
+
+    def get_forecast_api(self, longitude: str, latitude: str) -> {}:
+        """Returns the api result of a coordinate from the grid"""
+        grid = self.grid
+        if not self._is_fresh(grid):
+            with self._grid_lock:
+                # Another thread may have fetched it while this one waited
+                grid = self.grid
+                if not self._is_fresh(grid):
+                    grid = self.fetch()
+        return _get_api_result(grid, longitude, latitude)
+
+    async def async_get_forecast_api(self, longitude: str, latitude: str) -> {}:
+        """Returns the api result of a coordinate from the grid"""
+        grid = self.grid
+        if not self._is_fresh(grid):
+            # Shielded so a cancelled caller does not cancel the others
+            grid = await asyncio.shield(self._get_grid_task())
+        return _get_api_result(grid, longitude, latitude)
+
+    def invalidate_older(self, approved_time: str) -> List[SmhiCacheEntry]:
+        """Removes the cached forecasts and the grid from model runs
+        approved before approved_time, returns the cache entries removed"""
+        grid = self.grid
+        if grid is not None and (
+            grid.approved_time is None or grid.approved_time < approved_time
+        ):
+            self.grid = None
+        return super().invalidate_older(approved_time)
+
+    def fetch(self) -> SmhiMultipointGrid:
+        """Fetches the grid, the requests are made in parallel from a
+        thread pool sharing the connection pool"""
+        coordinates = self._get_json(MULTIPOINT_URL + ".json")
+        valid_times = self._get_json(MULTIPOINT_URL + "/validtime.json")
+        requests = self._get_requests(valid_times)
+
+        with ThreadPoolExecutor(max_workers=self.pool.pool_size) as executor:
+            results = list(
+                executor.map(self._get_json, [url for _, _, url in requests])
+            )
+
+        return self._set_grid(
+            self._get_grid(coordinates, valid_times, requests, results)
+        )
+
+    async def async_fetch(self) -> SmhiMultipointGrid:
+        """Fetches the grid asyncronious, at most pool_size requests are
+        made at the same time"""
+        session = self._get_session()
+        temporary_session = None
+        if session is None:
+            session = temporary_session = self._create_session()
+        semaphore = asyncio.Semaphore(self.pool.pool_size)
+
+        async def get_json(url: str) -> dict:
+            async with semaphore:
+                return await self._async_get_json(session, url)
+
+        try:
+            coordinates = await get_json(MULTIPOINT_URL + ".json")
+            valid_times = await get_json(MULTIPOINT_URL + "/validtime.json")
+            requests = self._get_requests(valid_times)
+            results = await asyncio.gather(*[get_json(url) for _, _, url in requests])
+        finally:
+            if temporary_session is not None:
+                await temporary_session.close()
+
+        return self._set_grid(
+            self._get_grid(coordinates, valid_times, requests, results)
+        )
+
+    def _is_fresh(self, grid: Optional[SmhiMultipointGrid]) -> bool:
+        """True if the grid is the current one and not older than grid_ttl"""
+        return (
+            grid is not None
+            and grid is self.grid
+            and self._clock() - self._fetched_at <= self._grid_ttl
+        )
+
+    def _set_grid(self, grid: SmhiMultipointGrid) -> SmhiMultipointGrid:
+        """Stores a fetched grid"""
+        self._fetched_at = self._clock()
+        self.grid = grid
+        return grid
+
+    def _get_grid_task(self) -> asyncio.Future:
+        """Returns the task fetching the grid, shared by concurrent calls"""
+        # Futures are bound to a loop so fetches are only shared per loop
+        loop = asyncio.get_running_loop()
+        task = self._grid_tasks.get(loop)
+        if task is None:
+            task = asyncio.ensure_future(self.async_fetch())
+            self._grid_tasks[loop] = task
+
+            def done(_) -> None:
+                self._grid_tasks.pop(loop, None)
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(done)
+        return task
+
+    def _get_requests(self, valid_times: dict) -> List[Tuple[int, str, str]]:
+        """Returns (valid time index, parameter, url) of the grids to get"""
+        requests = []
+        for time_index, valid_time in enumerate(valid_times["validTime"]):
+            compact = valid_time.replace("-", "").replace(":", "")
+            for name in self._parameters:
+                level_type, level = _LEVELS.get(name, _DEFAULT_LEVEL)
+                url = MULTIPOINT_URL + _DATA_PATH.format(
+                    compact, name, level_type, level
+                )
+                requests.append((time_index, name, url))
+        return requests
+
+    def _get_grid(
+        self,
+        coordinates: dict,
+        valid_times: dict,
+        requests: List[Tuple[int, str, str]],
+        results: List[dict],
+    ) -> SmhiMultipointGrid:
+        """Assembles the api results into a grid"""
+        points = [tuple(point) for point in coordinates["coordinates"]]
+        count = len(points)
+        times = valid_times["validTime"]
+        values = {
+            name: array("d", [math.nan]) * (len(times) * count)
+            for name in self._parameters
+        }
+
+        approved_time = reference_time = None
+        for (time_index, name, _), result in zip(requests, results):
+            approved_time = result.get("approvedTime", approved_time)
+            reference_time = result.get("referenceTime", reference_time)
+            for time_series in result.get("timeSeries", ()):
+                for param in time_series["parameters"]:
+                    if param["name"] != name:
+                        continue
+                    if len(param["values"]) != count:
+                        raise SmhiForecastException(
+                            "Expected {} values of {} but got {}".format(
+                                count, name, len(param["values"])
+                            )
+                        )
+                    start = time_index * count
+                    values[name][start : start + count] = array("d", param["values"])
+
+        return SmhiMultipointGrid(points, times, values, approved_time, reference_time)
+
+
+def _get_api_result(grid: SmhiMultipointGrid, longitude: str, latitude: str) -> dict:
+    """Returns the api result of the grid point closest to a coordinate"""
+    point = grid.point(longitude, latitude)
+    if point is None:
+        raise SmhiForecastException(
+            "Coordinate {}, {} is outside the grid".format(longitude, latitude)
+        )
+    return grid.get_api_result(point)
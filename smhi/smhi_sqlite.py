@@ -0,0 +1,280 @@
+"""
+Module smhi_sqlite contains the on disk cache of forecasts shared by
+the processes on a host
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from smhi.smhi_lib import JSON_LOADS
+
+_SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS forecasts (
+    longitude TEXT NOT NULL,
+    latitude TEXT NOT NULL,
+    approved_time TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (longitude, latitude, approved_time)
+);
+CREATE INDEX IF NOT EXISTS forecasts_accessed_at ON forecasts (accessed_at);
+CREATE TABLE IF NOT EXISTS forecasts_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO forecasts_size SELECT 0, COALESCE(SUM(size), 0) FROM forecasts;
+CREATE TRIGGER IF NOT EXISTS forecasts_size_insert AFTER INSERT ON forecasts
+BEGIN
+    UPDATE forecasts_size SET size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS forecasts_size_delete AFTER DELETE ON forecasts
+BEGIN
+    UPDATE forecasts_size SET size = size - old.size;
+END;
+COMMIT;
+"""
+
+
+class SmhiSqliteCache:
+    """
+    SQLite cache of api results keyed by (longitude, latitude, approvedTime).
+
+    The database is in WAL mode so any number of processes can read while
+    one writes. Results are stored as compressed json, only the latest
+    model run of each coordinate is kept, and the least recently used
+    results are evicted when they take more than max_bytes.
+
+    Use it as the backend of a SmhiForecastCache to keep the parsed
+    forecasts in memory and share the api results between processes.
+    Timestamps are wall clock time since they are shared.
+
+    get only reads, the time a result was used is updated at most once
+    per access_interval and skipped if another connection is writing, so
+    it never waits for a lock. put waits up to timeout for the writer
+    lock. The calls block, also when made by the async api on the event
+    loop, so keep the timeout short there.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.time,
+        timeout: float = 10.0,
+        access_interval: float = 60.0,
+    ) -> None:
+        """Constructor, the database is created if needed"""
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self._path = path
+        self._max_bytes = max_bytes
+        self._clock = clock
+        self._timeout = timeout
+        self._access_interval = access_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @property
+    def path(self) -> str:
+        """Path of the database"""
+        return self._path
+
+    @property
+    def max_bytes(self) -> int:
+        """Max size of the stored results before the least recently used
+        are evicted"""
+        return self._max_bytes
+
+    @property
+    def size(self) -> int:
+        """Bytes used by the stored results"""
+        return _get_size(self._connect())
+
+    def __len__(self) -> int:
+        row = self._connect().execute("SELECT COUNT(*) FROM forecasts").fetchone()
+        return row[0]
+
+    def now(self) -> float:
+        """The time of the cache clock"""
+        return self._clock()
+
+    def get(self, longitude: str, latitude: str) -> Optional[Tuple[dict, float]]:
+        """Returns the latest api result for the coordinates and when it was
+        stored, None if there is none or the database is locked"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT approved_time, stored_at, accessed_at, data FROM forecasts"
+                " WHERE longitude = ? AND latitude = ?"
+                " ORDER BY approved_time DESC LIMIT 1",
+                (longitude, latitude),
+            ).fetchone()
+        except sqlite3.OperationalError as error:
+            if not _is_locked(error):
+                raise
+            return None
+        if row is None:
+            return None
+        approved_time, stored_at, accessed_at, data = row
+
+        now = self._clock()
+        if now - accessed_at > self._access_interval:
+            self._touch(conn, longitude, latitude, approved_time, now)
+        return _decode(data), stored_at
+
+    def put(
+        self,
+        longitude: str,
+        latitude: str,
+        json_data: dict,
+        stored_at: Optional[float] = None,
+    ) -> None:
+        """Stores the api result for the coordinates, results of older model
+        runs for them are removed"""
+        approved_time = json_data.get("approvedTime") or ""
+        now = self._clock()
+        if stored_at is None:
+            stored_at = now
+        data = _encode(json_data)
+
+        conn = self._connect()
+        with conn:
+            # Deleted rather than replaced so the size triggers see it
+            conn.execute(
+                "DELETE FROM forecasts"
+                " WHERE longitude = ? AND latitude = ? AND approved_time <= ?",
+                (longitude, latitude, approved_time),
+            )
+            conn.execute(
+                "INSERT INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (longitude, latitude, approved_time, stored_at, now, len(data), data),
+            )
+            self._evict(conn)
+
+    def load(
+        self, limit: Optional[int] = None
+    ) -> Iterator[Tuple[str, str, dict, float]]:
+        """Yields (longitude, latitude, api result, stored at) of the most
+        recently used results first, used to warm up a memory cache"""
+        rows = self._connect().execute(
+            "SELECT longitude, latitude, stored_at, data FROM forecasts"
+            " ORDER BY accessed_at DESC LIMIT ?",
+            (-1 if limit is None else limit,),
+        )
+        for longitude, latitude, stored_at, data in rows:
+            yield longitude, latitude, _decode(data), stored_at
+
+    def invalidate(self, longitude: str, latitude: str) -> None:
+        """Removes the results for the coordinates"""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM forecasts WHERE longitude = ? AND latitude = ?",
+                (longitude, latitude),
+            )
+
+    def invalidate_older(self, approved_time: str) -> int:
+        """Removes the results of model runs approved before approved_time,
+        returns the number removed"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM forecasts WHERE approved_time < ?", (approved_time,)
+            )
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        """Removes all results"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM forecasts")
+
+    def close(self) -> None:
+        """Closes the connections of all threads"""
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self._path, timeout=self._timeout, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _touch(
+        self,
+        conn: sqlite3.Connection,
+        longitude: str,
+        latitude: str,
+        approved_time: str,
+        now: float,
+    ) -> None:
+        """Updates when a result was used, skipped if the database is
+        locked since it only orders the eviction"""
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE forecasts SET accessed_at = ?"
+                    " WHERE longitude = ? AND latitude = ? AND approved_time = ?",
+                    (now, longitude, latitude, approved_time),
+                )
+        except sqlite3.OperationalError as error:
+            if not _is_locked(error):
+                raise
+        finally:
+            conn.execute("PRAGMA busy_timeout = {}".format(int(self._timeout * 1000)))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Removes the least recently used results above max_bytes"""
+        total = _get_size(conn)
+        if total <= self._max_bytes:
+            return
+        evicted = []
+        for rowid, size in conn.execute(
+            "SELECT rowid, size FROM forecasts ORDER BY accessed_at"
+        ):
+            if total <= self._max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        conn.executemany("DELETE FROM forecasts WHERE rowid = ?", evicted)
+
+
+def _get_size(conn: sqlite3.Connection) -> int:
+    """Returns the bytes used by the stored results, kept by the triggers"""
+    return conn.execute("SELECT size FROM forecasts_size").fetchone()[0]
+
+
+def _is_locked(error: sqlite3.OperationalError) -> bool:
+    """True if the error is from another connection holding a lock"""
+    return "locked" in str(error)
+
+
+def _encode(json_data: dict) -> bytes:
+    """Returns the compressed json of an api result"""
+    return zlib.compress(json.dumps(json_data, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(data: bytes) -> dict:
+    """Returns the api result of compressed json"""
+    return JSON_LOADS(zlib.decompress(data))
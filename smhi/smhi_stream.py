@@ -0,0 +1,120 @@
+"""
+Module smhi_stream contains the incremental parser used to decode the
+timeSeries of a forecast while the response is still being received
+"""
+
+import json
+import re
+
+from typing import Callable, List
+
+# The bytes that changes the structure, everything else is skipped
+_STRUCTURE = re.compile(rb'["\\{}\[\]]')
+
+_OPENING = frozenset(b"{[")
+_CLOSING = frozenset(b"}]")
+
+
+class SmhiTimeSeriesParser:
+    """
+    Incremental parser of the timeSeries in an api result.
+
+    Feed it the body in chunks of any size, each timeSeries entry is
+    decoded as soon as it is complete. Only the entry being received is
+    buffered, so the memory used is bounded by the size of one timestep
+    rather than the whole forecast.
+    """
+
+    def __init__(self, loads: Callable[[bytes], dict] = json.loads) -> None:
+        """Constructor, loads decodes the bytes of one entry"""
+        self._loads = loads
+        self._buffer = bytearray()
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._key = None
+        self._in_series = False
+        self._entry_start = None
+        self._done = False
+
+    @property
+    def done(self) -> bool:
+        """True when the end of the timeSeries has been parsed"""
+        return self._done
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """Parses a chunk and returns the entries completed by it"""
+        if self._done:
+            return []
+        buffer = self._buffer
+        buffer += chunk
+        entries = []
+
+        position = self._position
+        depth = self._depth
+        in_string = self._in_string
+        for match in _STRUCTURE.finditer(buffer, position):
+            index = match.start()
+            if index < position:
+                # Skipped as the byte after a backslash
+                continue
+            char = buffer[index]
+            position = index + 1
+
+            if in_string:
+                if char == 0x5C:  # backslash, the next byte is escaped
+                    if index + 1 >= len(buffer):
+                        position = index
+                        break
+                    position = index + 2
+                elif char == 0x22:  # quote
+                    in_string = False
+                    if depth == 1:
+                        self._key = bytes(buffer[self._string_start + 1 : index])
+            elif char == 0x22:
+                in_string = True
+                self._string_start = index
+            elif char in _OPENING:
+                depth += 1
+                if depth == 2 and char == 0x5B and self._key == b"timeSeries":
+                    self._in_series = True
+                elif depth == 3 and self._in_series:
+                    self._entry_start = index
+            elif char in _CLOSING:
+                depth -= 1
+                if depth == 2 and self._entry_start is not None:
+                    entries.append(
+                        self._loads(bytes(buffer[self._entry_start : position]))
+                    )
+                    self._entry_start = None
+                elif depth == 1 and self._in_series:
+                    self._in_series = False
+                    self._done = True
+                    break
+                elif depth < 0:
+                    raise ValueError("Unbalanced brackets in api result")
+
+        # The match holds on to the buffer, which can then not be resized
+        match = None
+        self._depth = depth
+        self._in_string = in_string
+
+        # Only the entry and string being received are kept
+        keep = position
+        if self._entry_start is not None:
+            keep = self._entry_start
+        elif in_string:
+            keep = self._string_start
+        if keep:
+            del buffer[:keep]
+            if self._entry_start is not None:
+                self._entry_start -= keep
+            self._string_start -= keep
+        self._position = position - keep
+        return entries
+
+    def close(self) -> None:
+        """Raises ValueError if the end of the timeSeries was not parsed"""
+        if not self._done:
+            raise ValueError("The api result ended before the end of timeSeries")
@@ -0,0 +1,69 @@
+"""
+Module smhi_testing contains the helpers shared by the smhi tests, a
+local stand-in for the SMHI open data API and a fake clock
+"""
+
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _LocalHandler(BaseHTTPRequestHandler):
+    """Handler that delegates every GET to the server responder"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        """Counts the number of connections made to the server"""
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self) -> None:  # pylint: disable=C0103
+        """Returns the response from the responder"""
+        with self.server.lock:
+            self.server.requests.append((self.path, dict(self.headers)))
+        status, headers, body = self.server.responder(self)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:  # pylint: disable=W0221
+        """Keep the test output clean"""
+
+
+class LocalServer(ThreadingHTTPServer):
+    """Local stand-in for the SMHI open data API"""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _LocalHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.responder = lambda handler: (200, {}, json_body({}))
+
+    @property
+    def url(self) -> str:
+        """Base url of the server"""
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+def json_body(data) -> bytes:
+    """Encodes data as a json response body"""
+    return json.dumps(data).encode("utf-8")
+
+
+class FakeClock:
+    """Clock that only moves when told to"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
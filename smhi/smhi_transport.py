@@ -0,0 +1,411 @@
+"""
+Module smhi_transport contains the HTTP transport used by the
+syncronious SMHI API calls
+"""
+
+import base64
+import http.client
+import threading
+import time
+import urllib.request
+import zlib
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Size of the chunks read from the response and fed to the decoder
+CHUNK_SIZE = 65536
+
+if brotli is None:
+    ACCEPT_ENCODING = "gzip, deflate"
+else:
+    ACCEPT_ENCODING = "gzip, deflate, br"
+
+# Errors that means a pooled keep-alive connection was closed by the
+# server while it was idle, the request is safe to retry once
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class SmhiHttpResponse:
+    """
+    Class to hold a completed HTTP response
+    """
+
+    def __init__(self, status: int, headers: http.client.HTTPMessage, body: bytes):
+        """Constructor"""
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class SmhiTransferStats:
+    """
+    Thread safe byte counters for the responses received
+    """
+
+    def __init__(self) -> None:
+        """Constructor"""
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+
+    def record(self, bytes_received: int, bytes_decoded: int) -> None:
+        """Adds a response to the counters"""
+        with self._lock:
+            self.responses += 1
+            self.bytes_received += bytes_received
+            self.bytes_decoded += bytes_decoded
+
+    @property
+    def bytes_saved(self) -> int:
+        """Number of bytes compression saved"""
+        return self.bytes_decoded - self.bytes_received
+
+
+class SmhiHttpStream:
+    """
+    Class to hold a response whose body is read in decoded chunks
+    """
+
+    def __init__(
+        self, response: http.client.HTTPResponse, stats: SmhiTransferStats
+    ) -> None:
+        """Constructor"""
+        self.status = response.status
+        self.headers = response.headers
+        self._response = response
+        self._stats = stats
+        self.complete = False
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """Yields the decoded body in chunks as they are received"""
+        decoder = SmhiContentDecoder(self.headers.get("Content-Encoding"))
+        received = 0
+        decoded = 0
+        while True:
+            chunk = self._response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            chunk = decoder.decompress(chunk)
+            decoded += len(chunk)
+            if chunk:
+                yield chunk
+        chunk = decoder.flush()
+        decoded += len(chunk)
+        self._stats.record(received, decoded)
+        self.complete = True
+        if chunk:
+            yield chunk
+
+    def read(self) -> bytes:
+        """Returns the whole decoded body"""
+        return b"".join(self.iter_chunks())
+
+
+class SmhiContentDecoder:
+    """
+    Streaming decoder for a Content-Encoding, chunks are decoded as
+    they are received
+    """
+
+    def __init__(self, encoding: Optional[str]) -> None:
+        """Constructor"""
+        encoding = (encoding or "identity").strip().lower()
+        if encoding in ("identity", ""):
+            self._decoder = None
+        elif encoding in ("gzip", "x-gzip"):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self._decoder = zlib.decompressobj()
+        elif encoding == "br" and brotli is not None:
+            self._decoder = brotli.Decompressor()
+        else:
+            raise ValueError("Unsupported content encoding {}".format(encoding))
+        self._encoding = encoding
+        self._first_chunk = True
+
+    def decompress(self, chunk: bytes) -> bytes:
+        """Decodes a chunk"""
+        if self._decoder is None:
+            return chunk
+        if self._encoding == "deflate" and self._first_chunk:
+            self._first_chunk = False
+            try:
+                return self._decoder.decompress(chunk)
+            except zlib.error:
+                # Some servers sends raw deflate without the zlib wrapper
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        if self._encoding == "br":
+            return self._decoder.process(chunk)
+        return self._decoder.decompress(chunk)
+
+    def flush(self) -> bytes:
+        """Returns any remaining decoded data"""
+        if self._decoder is None or self._encoding == "br":
+            return b""
+        return self._decoder.flush()
+
+
+class SmhiConnectionPool:
+    """
+    Thread safe pool of persistent HTTP(S) connections.
+
+    Connections are kept alive between requests and reused by any thread,
+    at most pool_size connections are open per host at the same time.
+    Idle connections older than idle_timeout seconds are discarded.
+    With compression gzip, deflate and, if installed, brotli responses
+    are accepted and decoded while read. The bytes received and decoded
+    are counted in stats.
+
+    proxies maps url schemes to proxy urls, with hosts not to proxy in
+    "no", like urllib.request.getproxies. If None the HTTP_PROXY,
+    HTTPS_PROXY and NO_PROXY environment variables are used like urlopen
+    does. https is tunneled through the proxy with CONNECT.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        pool_size: int = 10,
+        idle_timeout: float = 30.0,
+        timeout: float = 30.0,
+        compression: bool = True,
+        proxies: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Constructor"""
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self._pool_size = pool_size
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._compression = compression
+        self._proxies_from_environment = proxies is None
+        self._proxies = urllib.request.getproxies() if proxies is None else proxies
+        # (scheme, host, port) -> proxy url or None
+        self._proxy_urls: Dict[Tuple[str, str, int], Optional[str]] = {}
+        self.stats = SmhiTransferStats()
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], deque] = {}
+        self._slots: Dict[Tuple[str, str, int], threading.BoundedSemaphore] = {}
+
+    @property
+    def pool_size(self) -> int:
+        """Max number of connections per host"""
+        return self._pool_size
+
+    @property
+    def idle_timeout(self) -> float:
+        """Seconds an idle connection is kept before it is discarded"""
+        return self._idle_timeout
+
+    @property
+    def compression(self) -> bool:
+        """True if compressed responses are accepted"""
+        return self._compression
+
+    @property
+    def accept_encoding(self) -> str:
+        """The Accept-Encoding to send"""
+        return ACCEPT_ENCODING if self._compression else "identity"
+
+    def request(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> SmhiHttpResponse:
+        """Performs a GET request using a pooled connection"""
+        with self.stream(url, headers) as response:
+            body = response.read()
+        return SmhiHttpResponse(response.status, response.headers, body)
+
+    @contextmanager
+    def stream(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Iterator[SmhiHttpStream]:
+        """
+        Performs a GET request using a pooled connection, the body is read
+        from the stream inside the with block. The connection is put back
+        in the pool if the whole body was read.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path = path + "?" + parts.query
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", self.accept_encoding)
+        proxy_url = self._get_proxy_url(key)
+        if proxy_url is not None and parts.scheme == "http":
+            # Plain http is forwarded by the proxy, which needs the whole url
+            path = url
+            headers.update(_proxy_headers(proxy_url))
+
+        slots = self._get_slots(key)
+        slots.acquire()
+        try:
+            conn, reused = self._checkout(key)
+            try:
+                response = self._send(conn, path, headers)
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # Server closed the idle connection, retry on a new one
+                conn = self._connect(key)
+                try:
+                    response = self._send(conn, path, headers)
+                except BaseException:
+                    conn.close()
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+            stream = SmhiHttpStream(response, self.stats)
+            try:
+                yield stream
+            except BaseException:
+                conn.close()
+                raise
+
+            if response.will_close or not stream.complete:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+        finally:
+            slots.release()
+
+    def close(self) -> None:
+        """Closes all idle connections"""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def _get_slots(self, key: Tuple[str, str, int]) -> threading.BoundedSemaphore:
+        """Returns the semaphore bounding the connections for a host"""
+        with self._lock:
+            slots = self._slots.get(key)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self._pool_size)
+                self._slots[key] = slots
+            return slots
+
+    def _checkout(
+        self, key: Tuple[str, str, int]
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        """Returns an idle connection if any, else a new one"""
+        now = time.monotonic()
+        expired = []
+        conn = None
+        with self._lock:
+            connections = self._idle.get(key)
+            while connections:
+                candidate, last_used = connections.pop()
+                if now - last_used > self._idle_timeout:
+                    expired.append(candidate)
+                    continue
+                conn = candidate
+                break
+            # Everything left is older than what we just popped
+            if connections and conn is not None:
+                while connections and now - connections[0][1] > self._idle_timeout:
+                    expired.append(connections.popleft()[0])
+
+        for candidate in expired:
+            candidate.close()
+
+        if conn is not None:
+            return conn, True
+        return self._connect(key), False
+
+    def _checkin(
+        self, key: Tuple[str, str, int], conn: http.client.HTTPConnection
+    ) -> None:
+        """Returns a connection to the idle pool"""
+        with self._lock:
+            connections = self._idle.setdefault(key, deque())
+            connections.append((conn, time.monotonic()))
+            overflow = None
+            if len(connections) > self._pool_size:
+                overflow = connections.popleft()[0]
+        if overflow is not None:
+            overflow.close()
+
+    def _connect(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        """Creates a new connection, to the proxy if the host is proxied"""
+        scheme, host, port = key
+        if scheme not in ("http", "https"):
+            raise ValueError("Unsupported url scheme {}".format(scheme))
+
+        proxy_url = self._get_proxy_url(key)
+        if proxy_url is None:
+            if scheme == "https":
+                return http.client.HTTPSConnection(host, port, timeout=self._timeout)
+            return http.client.HTTPConnection(host, port, timeout=self._timeout)
+
+        proxy = urlsplit(proxy_url)
+        if scheme == "http":
+            return http.client.HTTPConnection(
+                proxy.hostname, proxy.port, timeout=self._timeout
+            )
+        conn = http.client.HTTPSConnection(
+            proxy.hostname, proxy.port, timeout=self._timeout
+        )
+        conn.set_tunnel(host, port, headers=_proxy_headers(proxy_url))
+        return conn
+
+    def _get_proxy_url(self, key: Tuple[str, str, int]) -> Optional[str]:
+        """Returns the url of the proxy for a host, None if not proxied"""
+        with self._lock:
+            if key in self._proxy_urls:
+                return self._proxy_urls[key]
+
+        scheme, host, _ = key
+        proxy_url = self._proxies.get(scheme)
+        if proxy_url is not None:
+            if self._proxies_from_environment:
+                bypass = urllib.request.proxy_bypass(host)
+            else:
+                bypass = urllib.request.proxy_bypass_environment(host, self._proxies)
+            if bypass:
+                proxy_url = None
+            elif "://" not in proxy_url:
+                proxy_url = "http://" + proxy_url
+
+        with self._lock:
+            self._proxy_urls[key] = proxy_url
+        return proxy_url
+
+    @staticmethod
+    def _send(
+        conn: http.client.HTTPConnection, path: str, headers: Optional[Dict[str, str]]
+    ) -> http.client.HTTPResponse:
+        """Sends the request and returns the response"""
+        conn.request("GET", path, headers=headers or {})
+        return conn.getresponse()
+
+
+def _proxy_headers(proxy_url: str) -> Dict[str, str]:
+    """Returns the Proxy-Authorization for the credentials in a proxy url"""
+    proxy = urlsplit(proxy_url)
+    if proxy.username is None:
+        return {}
+    credentials = "{}:{}".format(unquote(proxy.username), unquote(proxy.password or ""))
+    token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return {"Proxy-Authorization": "Basic " + token}
@@ -0,0 +1,126 @@
+"""
+Module smhi_watcher contains the watcher that keeps cached forecasts
+in step with the model runs published by SMHI
+"""
+
+import asyncio
+import random
+
+from typing import Callable, List, Optional
+
+from smhi.smhi_cache import SmhiCacheEntry
+from smhi.smhi_lib import SmhiAPI
+
+
+class SmhiApprovedTimeWatcher:
+    """
+    Polls the small approvedtime.json of the api instead of the forecasts.
+
+    When a new model run is approved the cached forecasts from older runs
+    are invalidated, or with refresh fetched again. Each poll waits interval
+    plus a random part of jitter seconds, and a new run is acted on after
+    another random part of jitter, so many processes watching the same api
+    does not all call it at the same time.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        api: SmhiAPI,
+        interval: float = 300.0,
+        jitter: float = 30.0,
+        refresh: bool = False,
+        on_change: Optional[Callable[[str], None]] = None,
+        refresh_limit: int = 4,
+    ) -> None:
+        """Constructor, on_change is called with each new approvedTime"""
+        if interval < 0 or jitter < 0:
+            raise ValueError("interval and jitter must not be negative")
+        self._api = api
+        self._interval = interval
+        self._jitter = jitter
+        self._refresh = refresh
+        self._on_change = on_change
+        self._refresh_limit = refresh_limit
+        self._task: Optional[asyncio.Task] = None
+        self.approved_time: Optional[str] = None
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def running(self) -> bool:
+        """True while the watcher polls"""
+        return self._task is not None and not self._task.done()
+
+    async def check(self) -> bool:
+        """
+        Gets the approvedTime and acts on it if it is new, returns True if
+        it was. The first approvedTime seen counts as new.
+        """
+        self.last_error = None
+        result = await self._api.async_get_approved_time_api()
+        approved_time = result.get("approvedTime")
+        if approved_time is None or approved_time == self.approved_time:
+            return False
+
+        if self._jitter:
+            await asyncio.sleep(random.uniform(0, self._jitter))
+
+        # Only recorded once acted on, so a check cancelled in the jitter
+        # sees the same model run as new the next time
+        older = self._api.invalidate_older(approved_time)
+        self.approved_time = approved_time
+        if self._refresh:
+            await self._refresh_entries(older)
+
+        if self._on_change is not None:
+            self._on_change(approved_time)
+        return True
+
+    async def run(self) -> None:
+        """Polls until cancelled, errors are kept in last_error"""
+        while True:
+            try:
+                await self.check()
+            # Any error, also from on_change, must not stop the polling
+            except Exception as error:  # pylint: disable=W0703
+                self.last_error = error
+            await asyncio.sleep(self._interval + random.uniform(0, self._jitter))
+
+    def start(self) -> None:
+        """Starts polling in a task on the running loop"""
+        if not self.running:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        """Stops polling"""
+        task = self._task
+        self._task = None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def __aenter__(self) -> "SmhiApprovedTimeWatcher":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def _refresh_entries(self, entries: List[SmhiCacheEntry]) -> None:
+        """Fetches the forecasts of the entries again"""
+        semaphore = asyncio.Semaphore(self._refresh_limit)
+
+        async def refresh(entry: SmhiCacheEntry) -> None:
+            async with semaphore:
+                longitude, latitude = entry.coordinates
+                await self._api.async_get_forecast(
+                    longitude, latitude, entry.parameters
+                )
+
+        results = await asyncio.gather(
+            *[refresh(entry) for entry in entries if entry.coordinates is not None],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                self.last_error = result
@@ -0,0 +1,118 @@
+"""
+    Automatic tests for the smhi_archive
+"""
+# pylint: disable=W0621
+
+import copy
+
+import pytest
+from smhi import smhi_archive
+from smhi.smhi_archive import SmhiForecastArchive, write_archive
+from smhi.smhi_frame import ForecastFrame
+from smhi.test_smhi_lib import FakeSmhiApi, as_tuple
+
+APPROVED_TIME = "2018-09-01T14:06:18Z"
+
+
+@pytest.fixture
+def frames():
+    """Frames of two points, the second one a few degrees warmer"""
+    api_result = FakeSmhiApi().get_forecast_api("", "")
+    warmer = copy.deepcopy(api_result)
+    for time_series in warmer["timeSeries"]:
+        for param in time_series["parameters"]:
+            if param["name"] == "t":
+                param["values"][0] += 3
+    return [ForecastFrame.from_api(api_result), ForecastFrame.from_api(warmer)]
+
+
+@pytest.fixture
+def archive_path(tmp_path, frames) -> str:
+    """Archive of the frames"""
+    path = str(tmp_path / "forecasts.arc")
+    write_archive(path, frames, [(17.0, 62.1), (17.05, 62.1)], APPROVED_TIME)
+    return path
+
+
+def test_read_back(archive_path, frames):
+    """The archive has the same forecasts as the frames written"""
+    with SmhiForecastArchive(archive_path) as archive:
+        assert len(archive) == 2
+        assert archive.approved_time == APPROVED_TIME
+        assert archive.names == frames[0].names
+        assert list(archive.times) == list(frames[0].times)
+        assert archive.coordinates.tolist() == [[17.0, 62.1], [17.05, 62.1]]
+        for point, frame in enumerate(frames):
+            assert [as_tuple(forecast) for forecast in archive.frame(point)] == [
+                as_tuple(forecast) for forecast in frame
+            ]
+
+
+def test_zero_copy_views(archive_path, frames):
+    """Columns are read only views of the mapping"""
+    np = pytest.importorskip("numpy")
+    archive = SmhiForecastArchive(archive_path)
+    temperature = archive.column("temperature")
+
+    assert temperature.shape == (2, len(frames[0]))
+    assert not temperature.flags.owndata
+    assert not temperature.flags.writeable
+    assert np.allclose(temperature[1] - temperature[0], 3)
+
+
+def test_memoryview_views(archive_path, frames, monkeypatch):
+    """Without NumPy the views are memoryviews"""
+    monkeypatch.setattr(smhi_archive, "np", None)
+    archive = SmhiForecastArchive(archive_path)
+    temperature = archive.column("temperature")
+
+    assert isinstance(temperature, memoryview)
+    assert temperature.shape == (2, len(frames[0]))
+    assert temperature.readonly
+    assert [as_tuple(forecast) for forecast in archive.frame(-1)] == [
+        as_tuple(forecast) for forecast in frames[1]
+    ]
+    temperature.release()
+    archive.close()
+
+
+def test_point_lookup(archive_path):
+    """Coordinates are answered by the closest point"""
+    archive = SmhiForecastArchive(archive_path)
+    assert archive.point(17.0, 62.1) == 0
+    assert archive.point(17.049, 62.101) == 1
+    assert archive.point(18.0, 62.1) is None
+    with pytest.raises(IndexError):
+        archive.frame(2)
+    with pytest.raises(KeyError):
+        archive.column("foo")
+
+
+def test_not_an_archive(tmp_path, archive_path):
+    """Files that are not archives raises ValueError"""
+    path = tmp_path / "other.arc"
+    path.write_bytes(b"{}")
+    with pytest.raises(ValueError):
+        SmhiForecastArchive(str(path))
+
+    path.write_bytes(b"x" * 128)
+    with pytest.raises(ValueError):
+        SmhiForecastArchive(str(path))
+
+    with open(archive_path, "rb") as file:
+        path.write_bytes(file.read()[:-8])
+    with pytest.raises(ValueError):
+        SmhiForecastArchive(str(path))
+
+
+def test_write_mismatched_frames(tmp_path, frames):
+    """Frames must share the valid times and match the coordinates"""
+    path = str(tmp_path / "forecasts.arc")
+    shorter = frames[1].between(
+        frames[1][0].valid_time, frames[1][len(frames[1]) - 1].valid_time
+    )
+    with pytest.raises(ValueError):
+        write_archive(path, [frames[0], shorter], [(17.0, 62.1), (17.05, 62.1)])
+    with pytest.raises(ValueError):
+        write_archive(path, frames, [(17.0, 62.1)])
+    assert list(tmp_path.iterdir()) == []
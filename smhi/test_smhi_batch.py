@@ -0,0 +1,196 @@
+"""
+Automatic tests for the smhi_batch
+"""
+
+import asyncio
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from smhi.smhi_batch import SmhiBatch, SmhiThreadBatch
+from smhi.smhi_lib import SmhiAPI, SmhiForecastException
+from smhi.test_smhi_lib import FakeSmhiApi
+
+
+class TrackingSmhiApi(FakeSmhiApi):
+    """Fake api that tracks calls and concurrency"""
+
+    def __init__(self, failing=()) -> None:
+        self.failing = failing
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    async def async_get_forecast_api(self, longitude: str, latitude: str) -> {}:
+        self.calls.append((longitude, latitude))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.001)
+        self.running -= 1
+        if (longitude, latitude) in self.failing:
+            raise SmhiForecastException("Failed")
+        return self.get_forecast_api(longitude, latitude)
+
+
+class ThreadTrackingSmhiApi(FakeSmhiApi):
+    """Fake api that tracks calls and concurrency from threads"""
+
+    def __init__(self, failing=()) -> None:
+        self.failing = failing
+        self.lock = threading.Lock()
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    def get_forecast_api(self, longitude: str, latitude: str) -> {}:
+        with self.lock:
+            self.calls.append((longitude, latitude))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.001)
+        with self.lock:
+            self.running -= 1
+        if (longitude, latitude) in self.failing:
+            raise SmhiForecastException("Failed")
+        return super().get_forecast_api(longitude, latitude)
+
+
+async def collect(batch, coordinates):
+    """Returns all results of a batch"""
+    return [result async for result in batch.fetch_many(coordinates)]
+
+
+@pytest.mark.asyncio
+async def test_fetch_many():
+    """Every location gets its forecasts"""
+    api = TrackingSmhiApi()
+    coordinates = [(str(17 + i / 100), "62.1") for i in range(50)]
+    results = await collect(SmhiBatch(api=api, limit=5), coordinates)
+
+    assert len(results) == 50
+    assert all(result.ok and len(result.forecasts) == 12 for result in results)
+    assert sorted(result.coordinates for result in results) == sorted(
+        (str(float(lon)), lat) for lon, lat in coordinates
+    )
+    assert api.max_running <= 5
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_dedupes_rounded():
+    """Coordinates equal after rounding are fetched once"""
+    api = TrackingSmhiApi()
+    coordinates = [("17.0000001", "62.1"), ("17.0", "62.1000004"), ("17", "62.1")]
+    results = await collect(SmhiBatch(api=api), coordinates)
+
+    assert [result.coordinates for result in results] == [("17.0", "62.1")]
+    assert api.calls == [("17.0", "62.1")]
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_captures_errors():
+    """A failing location does not stop the others"""
+    api = TrackingSmhiApi(failing=[("18.0", "62.1")])
+    results = await collect(SmhiBatch(api=api), [("17.0", "62.1"), ("18.0", "62.1")])
+    by_coordinates = {result.coordinates: result for result in results}
+
+    assert by_coordinates[("17.0", "62.1")].ok
+    assert not by_coordinates[("18.0", "62.1")].ok
+    assert isinstance(by_coordinates[("18.0", "62.1")].error, SmhiForecastException)
+    assert by_coordinates[("18.0", "62.1")].forecasts is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_stop_early():
+    """Breaking out of the iteration cancels the remaining fetches"""
+    api = TrackingSmhiApi()
+    batch = SmhiBatch(api=api, limit=1)
+    results = batch.fetch_many([(str(17 + i), "62.1") for i in range(10)])
+    async for _ in results:
+        break
+    await results.aclose()
+
+    assert len(api.calls) < 10
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_fields():
+    """Only the fields asked for are decoded"""
+    batch = SmhiBatch(api=TrackingSmhiApi())
+    results = [
+        result
+        async for result in batch.fetch_many([("17.0", "62.1")], fields=["symbol"])
+    ]
+
+    assert results[0].forecasts[0].symbol == 1
+    assert results[0].forecasts[0].temperature is None
+
+
+def test_invalid_limit():
+    """The limit must be at least one"""
+    with pytest.raises(ValueError):
+        SmhiBatch(limit=0)
+    with pytest.raises(ValueError):
+        SmhiThreadBatch(max_workers=0)
+
+
+def test_thread_fetch_many():
+    """Results are ordered as the coordinates and fetched in parallel"""
+    api = ThreadTrackingSmhiApi()
+    coordinates = [(str(17 + i / 100), "62.1") for i in range(40)]
+    results = SmhiThreadBatch(api=api, max_workers=4).fetch_many(coordinates)
+
+    assert list(results) == [(str(float(lon)), lat) for lon, lat in coordinates]
+    assert all(result.ok and len(result.forecasts) == 12 for result in results.values())
+    assert 1 < api.max_running <= 4
+
+
+def test_thread_fetch_many_captures_errors():
+    """A failing location does not stop the others"""
+    api = ThreadTrackingSmhiApi(failing=[("18.0", "62.1")])
+    results = SmhiThreadBatch(api=api).fetch_many(
+        [("17.0", "62.1"), ("18.0", "62.1"), ("17.0000001", "62.1")]
+    )
+
+    assert list(results) == [("17.0", "62.1"), ("18.0", "62.1")]
+    assert results[("17.0", "62.1")].ok
+    assert isinstance(results[("18.0", "62.1")].error, SmhiForecastException)
+
+
+def test_thread_fetch_many_with_executor():
+    """A provided executor is used and left running"""
+    api = ThreadTrackingSmhiApi()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        batch = SmhiThreadBatch(api=api, executor=executor)
+        batch.fetch_many([("17.0", "62.1")])
+        results = batch.fetch_many([("18.0", "62.1")])
+
+    assert results[("18.0", "62.1")].ok
+    assert len(api.calls) == 2
+
+
+def test_thread_fetch_many_fields():
+    """Only the fields asked for are decoded"""
+    batch = SmhiThreadBatch(api=ThreadTrackingSmhiApi())
+    results = batch.fetch_many([("17.0", "62.1")], fields=["temperature"])
+    forecast = results[("17.0", "62.1")].forecasts[0]
+
+    assert forecast.temperature == 17
+    assert forecast.symbol is None
+
+
+def test_thread_batch_close(monkeypatch):
+    """Only the api created by the batch is closed"""
+    closed = []
+    monkeypatch.setattr(SmhiAPI, "close", lambda api: closed.append(api))
+
+    with SmhiThreadBatch() as batch:
+        owned = batch._api  # pylint: disable=W0212
+    assert closed == [owned]
+
+    api = ThreadTrackingSmhiApi()
+    monkeypatch.setattr(api, "close", lambda: closed.append(api))
+    with SmhiThreadBatch(api=api):
+        pass
+    assert closed == [owned]
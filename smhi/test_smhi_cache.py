@@ -0,0 +1,140 @@
+"""
+Automatic tests for the smhi_cache
+"""
+
+import pytest
+from smhi.smhi_cache import SmhiForecastCache, SmhiGridIndex
+from smhi.smhi_testing import FakeClock
+
+
+def test_get_fresh_entry():
+    """A stored entry is returned with both raw and parsed data"""
+    cache = SmhiForecastCache()
+    cache.put("17.0", "62.1", {"approvedTime": "2018-09-01T14:06:18Z"}, [1, 2])
+    entry = cache.get("17.0", "62.1")
+
+    assert entry.json_data == {"approvedTime": "2018-09-01T14:06:18Z"}
+    assert entry.forecasts == [1, 2]
+    assert entry.approved_time == "2018-09-01T14:06:18Z"
+    assert cache.get("18.0", "62.1") is None
+
+
+def test_ttl_expires_entry():
+    """Entries older than the ttl are not returned"""
+    clock = FakeClock()
+    cache = SmhiForecastCache(ttl=60, clock=clock)
+    cache.put("17.0", "62.1", {}, [])
+    clock.now = 60
+    assert cache.get("17.0", "62.1") is not None
+    clock.now = 61
+    assert cache.get("17.0", "62.1") is None
+
+
+def test_get_stale_entry():
+    """Entries up to max_stale past the ttl are returned by get_stale"""
+    clock = FakeClock()
+    cache = SmhiForecastCache(ttl=60, max_stale=30, clock=clock)
+    cache.put("17.0", "62.1", {}, [])
+    clock.now = 90
+    assert cache.get("17.0", "62.1") is None
+    assert cache.get_stale("17.0", "62.1") is not None
+    clock.now = 91
+    assert cache.get_stale("17.0", "62.1") is None
+
+    with pytest.raises(ValueError):
+        SmhiForecastCache(max_stale=-1)
+
+
+def test_lru_eviction():
+    """The least recently used entry is evicted first"""
+    cache = SmhiForecastCache(max_entries=2)
+    cache.put("1", "1", {}, [])
+    cache.put("2", "2", {}, [])
+    cache.get("1", "1")
+    cache.put("3", "3", {}, [])
+
+    assert len(cache) == 2
+    assert cache.get("1", "1") is not None
+    assert cache.get("2", "2") is None
+    assert cache.get("3", "3") is not None
+
+
+def test_invalidate_and_clear():
+    """Entries can be removed one by one or all at once"""
+    cache = SmhiForecastCache()
+    cache.put("1", "1", {}, [])
+    cache.put("2", "2", {}, [])
+    cache.invalidate("1", "1")
+    assert cache.get("1", "1") is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_invalidate_older():
+    """Entries from model runs approved before are removed and returned"""
+    cache = SmhiForecastCache()
+    cache.put("17.0", "62.1", {"approvedTime": "2018-09-01T14:06:18Z"}, [1])
+    cache.put("18.0", "62.1", {"approvedTime": "2018-09-01T15:06:18Z"}, [2])
+    cache.put("19.0", "62.1", {}, [3])
+    removed = cache.invalidate_older("2018-09-01T15:06:18Z")
+
+    assert [entry.coordinates for entry in removed] == [("17.0", "62.1")]
+    assert cache.get("17.0", "62.1") is None
+    assert len(cache) == 2
+
+
+def test_invalid_max_entries():
+    """The cache must hold at least one entry"""
+    with pytest.raises(ValueError):
+        SmhiForecastCache(max_entries=0)
+
+
+def test_grid_index_nearest_point():
+    """Coordinates within the radius resolves to the nearest grid point"""
+    index = SmhiGridIndex()
+    index.add(16.024394, 63.341937)
+    index.add(16.074394, 63.341937)
+
+    assert index.lookup(16.03, 63.34) == (16.024394, 63.341937)
+    assert index.lookup(16.07, 63.345) == (16.074394, 63.341937)
+    assert index.lookup(16.05, 63.40) is None
+    assert len(index) == 2
+
+
+def test_grid_index_learned_mapping():
+    """A learned coordinate resolves even if far from the grid point"""
+    index = SmhiGridIndex(max_mappings=1)
+    index.learn(17.041, 62.34198, 16.024394, 63.341937)
+    assert index.lookup(17.041, 62.34198) == (16.024394, 63.341937)
+
+    index.learn(18.0, 60.0, 18.01, 60.01)
+    assert index.lookup(17.041, 62.34198) is None
+
+
+def test_grid_index_invalid_radius():
+    """The radius must be positive"""
+    with pytest.raises(ValueError):
+        SmhiGridIndex(radius=0)
+
+
+def test_cache_with_grid_index():
+    """Any coordinate in a fetched grid cell is served from the cache"""
+    cache = SmhiForecastCache(grid_index=SmhiGridIndex())
+    json_data = {"geometry": {"coordinates": [[16.024394, 63.341937]]}}
+    cache.put("17.041", "62.34198", json_data, [1])
+
+    assert cache.get("17.041", "62.34198").forecasts == [1]
+    assert cache.get("16.03", "63.34").forecasts == [1]
+    assert cache.get("16.05", "63.40") is None
+    assert len(cache) == 1
+
+    cache.invalidate("16.03", "63.34")
+    assert cache.get("17.041", "62.34198") is None
+
+
+def test_cache_with_grid_index_without_geometry():
+    """Results without geometry are keyed by the coordinates"""
+    cache = SmhiForecastCache(grid_index=SmhiGridIndex())
+    cache.put("17.041", "62.34198", {}, [1])
+
+    assert cache.get("17.041", "62.34198").forecasts == [1]
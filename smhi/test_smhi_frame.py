@@ -0,0 +1,178 @@
+"""
+Automatic tests for the smhi_frame
+"""
+
+# pylint: disable=W0212
+
+import copy
+import random
+
+from datetime import datetime, timezone
+
+import pytest
+from smhi import smhi_frame
+from smhi.smhi_frame import (
+    FRAME_COLUMNS,
+    ForecastFrame,
+    aggregate_daily,
+    aggregate_daily_frames,
+)
+from smhi.smhi_lib import _get_all_forecast_from_api, _get_forecast
+from smhi.test_smhi_lib import FakeSmhiApi
+
+PROPERTIES = (
+    "temperature",
+    "temperature_max",
+    "temperature_min",
+    "humidity",
+    "pressure",
+    "thunder",
+    "cloudiness",
+    "precipitation",
+    "mean_precipitation",
+    "total_precipitation",
+    "wind_speed",
+    "wind_direction",
+    "horizontal_visibility",
+    "wind_gust",
+    "symbol",
+    "valid_time",
+)
+
+
+def as_tuple(forecast):
+    """Returns the values of a forecast"""
+    return tuple(getattr(forecast, name) for name in PROPERTIES)
+
+
+@pytest.fixture(params=["numpy", "array"])
+def frame(request, monkeypatch) -> ForecastFrame:
+    """Returns a frame of the fixture, with and without numpy"""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(smhi_frame, "np", None)
+    return ForecastFrame.from_api(FakeSmhiApi().get_forecast_api("", ""))
+
+
+def test_frame_matches_forecasts(frame):
+    """Lazy forecasts equals the ones from _get_all_forecast_from_api"""
+    forecasts_ordered = _get_all_forecast_from_api(
+        FakeSmhiApi().get_forecast_api("", "")
+    )
+    expected = [as_tuple(f) for day in forecasts_ordered.values() for f in day]
+
+    assert len(frame) == 71
+    assert [as_tuple(f) for f in frame.forecasts()] == expected
+    assert as_tuple(frame[-1]) == expected[-1]
+    with pytest.raises(IndexError):
+        frame[71]  # pylint: disable=W0104
+
+
+def test_frame_columns(frame):
+    """Columns holds the decoded values"""
+    assert frame.names == FRAME_COLUMNS
+    assert frame.column("temperature")[0] == 17.0
+    assert frame.column("cloudiness")[0] == 50
+    assert frame.times[0] == datetime(2018, 9, 1, 15, tzinfo=timezone.utc).timestamp()
+    with pytest.raises(KeyError):
+        frame.column("unknown")
+
+
+def test_frame_between(frame):
+    """Slicing by time keeps the steps in the range, without copying"""
+    day = frame.between(datetime(2018, 9, 2), datetime(2018, 9, 3))
+
+    assert len(day) == 24
+    assert day[0].valid_time == datetime(2018, 9, 2, tzinfo=timezone.utc)
+    assert day[-1].valid_time == datetime(2018, 9, 2, 23, tzinfo=timezone.utc)
+    assert _shares_memory(day.column("temperature"), frame.column("temperature"))
+    assert len(frame.between(datetime(2019, 1, 1), datetime(2019, 1, 2))) == 0
+
+
+def test_frame_column_length_mismatch():
+    """All columns must have one value per time"""
+    with pytest.raises(ValueError):
+        ForecastFrame([1, 2], {"temperature": [1.0]})
+
+
+def _shares_memory(first, second) -> bool:
+    """True if both columns are views of the same buffer"""
+    if isinstance(first, memoryview):
+        return first.obj is second.obj
+    return smhi_frame.np.shares_memory(first, second)
+
+
+def random_payloads(count: int) -> list:
+    """Returns copies of the fixture with random temperatures and
+    precipitation"""
+    rng = random.Random(4711)
+    payloads = []
+    for _ in range(count):
+        payload = copy.deepcopy(FakeSmhiApi().get_forecast_api("", ""))
+        for step in payload["timeSeries"]:
+            for param in step["parameters"]:
+                if param["name"] == "t":
+                    param["values"] = [round(rng.uniform(-30, 30), 1)]
+                elif param["name"] == "pmean":
+                    param["values"] = [round(rng.uniform(0, 5), rng.choice((1, 2, 3)))]
+        payloads.append(payload)
+    return payloads
+
+
+def test_aggregate_daily_matches_scalar():
+    """The vectorized daily values are bit for bit the scalar ones"""
+    pytest.importorskip("numpy")
+    payloads = random_payloads(50)
+    aggregate = aggregate_daily_frames([ForecastFrame.from_api(p) for p in payloads])
+
+    assert aggregate.temperature_max.shape == (50, 11)
+    assert aggregate.days[0] == datetime(2018, 9, 1, tzinfo=timezone.utc).timestamp()
+    for location, payload in enumerate(payloads):
+        daily = _get_forecast(payload)[1:]
+        for day, forecast in enumerate(daily):
+            assert forecast.temperature_max == aggregate.temperature_max[location, day]
+            assert forecast.temperature_min == aggregate.temperature_min[location, day]
+            assert (
+                float(aggregate.total_precipitation[location, day]).hex()
+                == float(forecast.total_precipitation).hex()
+            )
+            assert (
+                float(aggregate.mean_precipitation[location, day]).hex()
+                == float(forecast.mean_precipitation).hex()
+            )
+
+
+def test_round_like_python():
+    """Rounding gives the same floats as the builtin, also next to a half"""
+    np = pytest.importorskip("numpy")
+    values = np.array(
+        [0.125, 0.155, 3.195, 1.005, 2.675, -0.005, 0.3 * 3, 0.1 * 6, 1e-9, 7.0]
+        + [random.Random(1).uniform(0, 100) for _ in range(1000)]
+    )
+    rounded = smhi_frame._round_like_python(values, 2)
+
+    assert [float(v).hex() for v in rounded] == [
+        round(float(v), 2).hex() for v in values
+    ]
+
+
+def test_aggregate_daily_frames_needs_same_times():
+    """Frames with different times can not be aggregated together"""
+    pytest.importorskip("numpy")
+    payload = FakeSmhiApi().get_forecast_api("", "")
+    frame = ForecastFrame.from_api(payload)
+
+    with pytest.raises(ValueError):
+        aggregate_daily_frames(
+            [frame, frame.between(datetime(2018, 9, 2), datetime(2018, 9, 3))]
+        )
+    with pytest.raises(ValueError):
+        aggregate_daily_frames([])
+
+
+def test_aggregate_daily_without_numpy(monkeypatch):
+    """The vectorized engine needs numpy"""
+    monkeypatch.setattr(smhi_frame, "np", None)
+    with pytest.raises(ImportError):
+        aggregate_daily([0], [[1.0]], [[0.0]])
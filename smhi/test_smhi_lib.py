@@ -3,7 +3,15 @@
 """
 # pylint: disable=C0302,W0621,R0903, W0212
 
-from datetime import datetime
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import List
 
 import aiohttp
@@ -13,9 +21,13 @@ from smhi.smhi_lib import (
     SmhiForecast,
     SmhiAPIBase,
     SmhiAPI,
+    SmhiClientRegistry,
     SmhiForecastException,
+    ALL_PARAMETERS,
 )
 from smhi import smhi_lib
+from smhi.smhi_cache import SmhiForecastCache, SmhiGridIndex
+from smhi.smhi_testing import FakeClock, json_body
 
 import logging
 
@@ -150,7 +162,39 @@ def test_symbol(first_smhi_forecast):
 
 def test_valid_time(first_smhi_forecast):
     """test"""
-    assert first_smhi_forecast.valid_time == datetime(2018, 9, 1, 15, 0, 0)
+    assert first_smhi_forecast.valid_time == datetime(
+        2018, 9, 1, 15, 0, 0, tzinfo=timezone.utc
+    )
+
+
+def test_parse_valid_time():
+    """validTime is parsed to UTC datetimes and shared between calls"""
+    valid_time = smhi_lib._parse_valid_time("2018-09-01T15:00:00Z")
+
+    assert valid_time == datetime(2018, 9, 1, 15, 0, 0, tzinfo=timezone.utc)
+    assert smhi_lib._parse_valid_time("2018-09-01T15:00:00Z") is valid_time
+    assert smhi_lib._parse_valid_time("2018-9-01T15:00:00Z") == valid_time
+    with pytest.raises(ValueError):
+        smhi_lib._parse_valid_time("2018-09-01 15:00:00")
+
+
+def test_daily_forecasts_leaves_hourly_untouched():
+    """The daily summaries are new objects"""
+    forecasts_ordered = smhi_lib._get_all_forecast_from_api(
+        FakeSmhiApi().get_forecast_api("", "")
+    )
+    hourly = [forecast for day in forecasts_ordered.values() for forecast in day]
+    before = [(f.temperature_max, f.total_precipitation) for f in hourly]
+    daily = smhi_lib._get_daily_forecasts(forecasts_ordered)
+
+    assert [(f.temperature_max, f.total_precipitation) for f in hourly] == before
+    assert daily[0] is hourly[0]
+    assert not any(forecast in hourly for forecast in daily[1:])
+
+
+def test_forecast_is_slotted(first_smhi_forecast):
+    """Forecasts has no per instance dict"""
+    assert not hasattr(first_smhi_forecast, "__dict__")
 
 
 def test_cloudiness_when_inconclusive(first_smhi_forecast2):
@@ -243,6 +287,556 @@ async def test_async_error_from_api():
         await smhi_error.async_get_forecast()
 
 
+@pytest.fixture
+def local_api_url(local_server, monkeypatch):
+    """Points the api to the local server"""
+    monkeypatch.setattr(
+        smhi_lib, "APIURL_TEMPLATE", local_server.url + "/lon/{}/lat/{}/data.json"
+    )
+    local_server.responder = lambda handler: (
+        200,
+        {},
+        json_body(FakeSmhiApi().get_forecast_api("", "")),
+    )
+    return local_server
+
+
+@pytest.mark.asyncio
+async def test_async_context_owns_session(local_api_url):
+    """The api owns one session for the lifetime of the async with block"""
+    api = SmhiAPI()
+    async with api:
+        session = api._get_session()
+        assert session is not None
+        await api.async_get_forecast_api("17.0", "62.1")
+        await api.async_get_forecast_api("17.0", "62.1")
+        assert api._get_session() is session
+
+    assert session.closed
+    assert api._get_session() is None
+    assert local_api_url.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_async_context_nested(local_api_url):
+    """Nested blocks keep the session until the outermost exits"""
+    api = SmhiAPI()
+    async with Smhi("17.0", "62.1", api=api) as smhi:
+        async with Smhi("18.0", "63.1", api=api) as other:
+            assert len(await other.async_get_forecast()) == 12
+        assert api._get_session() is not None
+        assert len(await smhi.async_get_forecast()) == 12
+
+    assert api._get_session() is None
+    assert local_api_url.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_async_without_context(local_api_url):
+    """Calls outside a block use a short lived session"""
+    api = SmhiAPI()
+    assert await api.async_get_forecast_api("17.0", "62.1")
+    assert api.session is None
+    assert api._get_session() is None
+
+
+@pytest.mark.asyncio
+async def test_async_context_keeps_provided_session(local_api_url):
+    """A provided session is used and never closed by the api"""
+    api = SmhiAPI()
+    api.session = aiohttp.ClientSession()
+    async with api:
+        assert not api._owned_sessions[asyncio.get_running_loop()][0]
+        assert await api.async_get_forecast_api("17.0", "62.1")
+
+    assert not api.session.closed
+    await api.session.close()
+
+
+def test_async_context_per_loop(local_api_url):
+    """Each event loop gets its own owned session"""
+    api = SmhiAPI()
+    barrier = threading.Barrier(2)
+
+    async def fetch():
+        async with api:
+            session = api._get_session()
+            await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+            await api.async_get_forecast_api("17.0", "62.1")
+            return session
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sessions = list(executor.map(lambda _: asyncio.run(fetch()), range(2)))
+
+    assert sessions[0] is not sessions[1]
+    assert all(session.closed for session in sessions)
+    assert not api._owned_sessions
+
+
+def test_smhi_shares_default_client() -> None:
+    """Smhi objects without api share the default client"""
+    first = Smhi("17.0", "62.1")
+    second = Smhi("18.0", "63.1")
+
+    assert first._api is second._api
+    assert first._api is smhi_lib.CLIENTS.get()
+
+
+@pytest.mark.asyncio
+async def test_smhi_session_does_not_rebind_shared_client() -> None:
+    """A session given to one Smhi is not used by the others"""
+    session = aiohttp.ClientSession()
+    with_session = Smhi("17.0", "62.1", session=session)
+    without_session = Smhi("17.0", "62.1")
+    await session.close()
+
+    assert with_session._api.session is session
+    assert with_session._api is not without_session._api
+    assert without_session._api.session is None
+
+
+def test_client_registry() -> None:
+    """Named clients are created once and can be registered"""
+    registry = SmhiClientRegistry()
+    client = registry.get("dashboards")
+    fake = FakeSmhiApi()
+    registry.register("fake", fake)
+
+    assert registry.get("dashboards") is client
+    assert registry.get("fake") is fake
+    assert isinstance(client, SmhiAPI)
+    assert Smhi("17.0", "62.1", api=registry.get("fake"))._api is fake
+    registry.close()
+
+
+def etag_responder(handler):
+    """Returns 304 when the client already has the forecast"""
+    if handler.headers.get("If-None-Match") == '"run-1"':
+        return (304, {"ETag": '"run-1"'}, b"")
+    return (
+        200,
+        {"ETag": '"run-1"', "Last-Modified": "Sat, 01 Sep 2018 14:06:18 GMT"},
+        json_body(FakeSmhiApi().get_forecast_api("", "")),
+    )
+
+
+def test_conditional_request(local_api_url):
+    """A not modified forecast reuses the cached result"""
+    local_api_url.responder = etag_responder
+    api = SmhiAPI(cache=SmhiForecastCache(ttl=0))
+    api.get_forecast("17.0", "62.1")
+    first = api.cache.peek("17.0", "62.1").json_data
+    second = api.get_forecast_api("17.0", "62.1")
+    api.close()
+
+    assert second is first
+    headers = local_api_url.requests[1][1]
+    assert headers["If-None-Match"] == '"run-1"'
+    assert headers["If-Modified-Since"] == "Sat, 01 Sep 2018 14:06:18 GMT"
+
+
+@pytest.mark.asyncio
+async def test_async_conditional_request(local_api_url):
+    """A not modified forecast reuses the remembered result asyncronious"""
+    local_api_url.responder = etag_responder
+    async with SmhiAPI(cache=SmhiForecastCache(ttl=0)) as api:
+        await api.async_get_forecast("17.0", "62.1")
+        first = api.cache.peek("17.0", "62.1").json_data
+        second = await api.async_get_forecast_api("17.0", "62.1")
+
+    assert second is first
+    assert local_api_url.requests[1][1]["If-None-Match"] == '"run-1"'
+
+
+def test_conditional_request_reuses_parsed_forecast(local_api_url):
+    """Not modified forecasts are not parsed again"""
+    local_api_url.responder = etag_responder
+    api = SmhiAPI(cache=SmhiForecastCache(ttl=0))
+    smhi = Smhi("17.0", "62.1", api=api)
+    first = smhi.get_forecast()
+    second = smhi.get_forecast()
+    api.close()
+
+    assert len(local_api_url.requests) == 2
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_conditional_requests_disabled(local_api_url):
+    """Without conditional requests no validators are sent"""
+    local_api_url.responder = etag_responder
+    api = SmhiAPI(conditional_requests=False, cache=SmhiForecastCache(ttl=0))
+    api.get_forecast("17.0", "62.1")
+    api.get_forecast("17.0", "62.1")
+    api.close()
+
+    assert "If-None-Match" not in local_api_url.requests[1][1]
+
+
+def test_conditional_requests_need_cache(local_api_url):
+    """Without a cache no results are kept for conditional requests"""
+    local_api_url.responder = etag_responder
+    api = SmhiAPI()
+    api.get_forecast_api("17.0", "62.1")
+    api.get_forecast_api("17.0", "62.1")
+    api.close()
+
+    assert not api._validators
+    assert "If-None-Match" not in local_api_url.requests[1][1]
+
+
+def test_conditional_request_evicted_result(local_api_url):
+    """A result no longer in the cache is requested without validators"""
+    local_api_url.responder = etag_responder
+    api = SmhiAPI(cache=SmhiForecastCache(ttl=0))
+    api.get_forecast("17.0", "62.1")
+    api.cache.invalidate("17.0", "62.1")
+    forecasts = api.get_forecast("17.0", "62.1")
+    api.close()
+
+    assert "If-None-Match" not in local_api_url.requests[1][1]
+    assert len(forecasts) > 0
+
+
+@pytest.mark.asyncio
+async def test_async_context_fake_api():
+    """Api implementations without own resources works in async with"""
+    async with Smhi("17.0", "62.1", api=FakeSmhiApi()) as smhi:
+        assert len(await smhi.async_get_forecast()) == 12
+
+
+def test_cache_reuses_forecast() -> None:
+    """Cached forecasts are returned without calling the api"""
+    api = CountingSmhiApi(cache=SmhiForecastCache())
+    first = Smhi("17.041", "62.34198", api=api).get_forecast()
+    second = Smhi("17.041", "62.34198", api=api).get_forecast()
+
+    assert api.calls == 1
+    assert first == second
+    assert first is not second
+    assert api.cache.get("17.041", "62.34198").json_data["timeSeries"]
+
+
+@pytest.mark.asyncio
+async def test_async_cache_reuses_forecast() -> None:
+    """Cached forecasts are returned without calling the async api"""
+    api = CountingSmhiApi(cache=SmhiForecastCache())
+    smhi = Smhi("17.041", "62.34198", api=api)
+    await smhi.async_get_forecast()
+    forecasts = await smhi.async_get_forecast()
+
+    assert api.calls == 1
+    assert len(forecasts) == 12
+
+
+def test_cache_grid_snapping() -> None:
+    """Coordinates in a fetched grid cell does not call the api"""
+    api = CountingSmhiApi(cache=SmhiForecastCache(grid_index=SmhiGridIndex()))
+    Smhi("17.041", "62.34198", api=api).get_forecast()
+    forecasts = Smhi("16.03", "63.34", api=api).get_forecast()
+
+    assert api.calls == 1
+    assert len(forecasts) == 12
+
+
+@pytest.mark.asyncio
+async def test_async_concurrent_calls_are_shared() -> None:
+    """Concurrent calls for the same coordinates share one api call"""
+    api = SlowSmhiApi()
+    results = await asyncio.gather(
+        *[Smhi("17.041", "62.34198", api=api).async_get_forecast() for _ in range(10)]
+    )
+    other = await Smhi("18.0", "62.34198", api=api).async_get_forecast()
+
+    assert api.calls == 2
+    assert all(result == results[0] for result in results)
+    assert results[0] is not results[1]
+    assert len(other) == 12
+    assert api.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_async_concurrent_calls_share_errors() -> None:
+    """All concurrent callers gets the error of the shared call"""
+    api = SlowSmhiApi(error=SmhiForecastException("Failed"))
+    results = await asyncio.gather(
+        *[Smhi("17.041", "62.34198", api=api).async_get_forecast() for _ in range(3)],
+        return_exceptions=True,
+    )
+
+    assert api.calls == 1
+    assert all(isinstance(result, SmhiForecastException) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_async_cancelled_caller_does_not_cancel_others() -> None:
+    """Cancelling one caller leaves the shared call running"""
+    api = SlowSmhiApi()
+    smhi = Smhi("17.041", "62.34198", api=api)
+    first = asyncio.ensure_future(smhi.async_get_forecast())
+    second = asyncio.ensure_future(smhi.async_get_forecast())
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert len(await second) == 12
+    assert api.calls == 1
+
+
+def test_without_cache_always_calls_api() -> None:
+    """No cache means every call goes to the api"""
+    api = CountingSmhiApi()
+    smhi = Smhi("17.041", "62.34198", api=api)
+    smhi.get_forecast()
+    smhi.get_forecast()
+
+    assert api.calls == 2
+
+
+def test_extended_parameters(smhi) -> None:
+    """The extended parameters are decoded when asked for"""
+    forecast = smhi.get_forecast(parameters=ALL_PARAMETERS)[0]
+    default = smhi.get_forecast()[0]
+
+    assert forecast.precipitation_min == 0.0
+    assert forecast.frozen_precipitation == -9
+    assert forecast.low_cloudiness == 0
+    assert forecast.medium_cloudiness is not None
+    assert forecast.high_cloudiness is not None
+    assert forecast.precipitation_max is not None
+    assert forecast.precipitation_median is not None
+    assert forecast.temperature == default.temperature
+    assert forecast.symbol == default.symbol
+    assert default.precipitation_min is None
+    assert default.high_cloudiness is None
+    assert default._extended is None  # pylint: disable=W0212
+
+
+def test_parameter_subset(smhi) -> None:
+    """Parameters left out are None, also in the daily summaries"""
+    forecasts = smhi.get_forecast(parameters=["t", "Wsymb2"])
+    default = smhi.get_forecast()
+
+    for forecast, expected in zip(forecasts, default):
+        assert forecast.temperature == expected.temperature
+        assert forecast.temperature_max == expected.temperature_max
+        assert forecast.temperature_min == expected.temperature_min
+        assert forecast.symbol == expected.symbol
+        assert forecast.humidity is None
+        assert forecast.mean_precipitation is None
+        assert forecast.total_precipitation is None
+
+
+def test_unknown_parameter(smhi) -> None:
+    """Unknown parameters raises ValueError"""
+    with pytest.raises(ValueError):
+        smhi.get_forecast(parameters=["t", "foo"])
+
+
+def test_cache_reparses_other_parameters() -> None:
+    """Other parameters are parsed from the cached api result"""
+    api = CountingSmhiApi(cache=SmhiForecastCache())
+    smhi = Smhi("17.041", "62.34198", api=api)
+    smhi.get_forecast()
+    forecasts = smhi.get_forecast(parameters=ALL_PARAMETERS)
+
+    assert api.calls == 1
+    assert forecasts[0].frozen_precipitation == -9
+    assert api.cache.get("17.041", "62.34198").parameters == ALL_PARAMETERS
+
+
+def test_fields_projection(smhi) -> None:
+    """Only the parameters behind the fields are decoded"""
+    forecasts = smhi.get_forecast(fields=["temperature_max", "symbol"])
+    expected = smhi.get_forecast(parameters=["t", "Wsymb2"])
+
+    assert [as_tuple(forecast) for forecast in forecasts] == [
+        as_tuple(forecast) for forecast in expected
+    ]
+    assert forecasts[2].temperature_max == 21
+    assert forecasts[1].humidity is None
+
+
+def test_fields_invalid(smhi) -> None:
+    """Unknown fields, or fields and parameters both, raises ValueError"""
+    with pytest.raises(ValueError):
+        smhi.get_forecast(fields=["foo"])
+    with pytest.raises(ValueError):
+        smhi.get_forecast(parameters=["t"], fields=["temperature"])
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 4, 6])
+def test_parameter_subsets_decode_as_all(size) -> None:
+    """A subset of the parameters decodes the same values as all of them,
+    the fields of the parameters left out are None"""
+    payload = FakeSmhiApi().get_forecast_api("", "")
+    every = smhi_lib._get_all_forecast_from_api(payload, ALL_PARAMETERS)
+    rnd = random.Random(size)
+    for _ in range(5):
+        parameters = frozenset(rnd.sample(sorted(ALL_PARAMETERS), size))
+        subset = smhi_lib._get_all_forecast_from_api(payload, parameters)
+
+        assert list(subset) == list(every)
+        for day in every:
+            for forecast, expected in zip(subset[day], every[day]):
+                for field, name in smhi_lib._FIELD_PARAMETERS.items():
+                    if name is None or name in parameters:
+                        assert getattr(forecast, field) == getattr(expected, field)
+                    else:
+                        assert getattr(forecast, field) is None
+
+
+def as_tuple(forecast: SmhiForecast) -> tuple:
+    """Returns all the values of a forecast"""
+    return tuple(getattr(forecast, name) for name in SmhiForecast.__slots__)
+
+
+def hourly_forecasts(parameters=smhi_lib.DEFAULT_PARAMETERS) -> List[tuple]:
+    """Returns the values of the hourly forecasts of the fixture"""
+    payload = FakeSmhiApi().get_forecast_api("", "")
+    forecasts_ordered = smhi_lib._get_all_forecast_from_api(payload, parameters)
+    return [as_tuple(item) for day in forecasts_ordered.values() for item in day]
+
+
+def test_stream_forecast(local_api_url) -> None:
+    """The hourly forecasts are streamed from the api"""
+    api = SmhiAPI()
+    forecasts = Smhi("17.0", "62.1", api=api).stream_forecast(fields=["symbol"])
+
+    assert [as_tuple(item) for item in forecasts] == hourly_forecasts(
+        frozenset(["Wsymb2"])
+    )
+    assert api.stats.responses == 1
+    api.close()
+
+
+@pytest.mark.asyncio
+async def test_async_stream_forecast(local_api_url) -> None:
+    """The hourly forecasts are streamed from the async api"""
+    async with Smhi("17.0", "62.1", api=SmhiAPI()) as smhi:
+        forecasts = [item async for item in smhi.async_stream_forecast()]
+
+    assert [as_tuple(item) for item in forecasts] == hourly_forecasts()
+
+
+@pytest.mark.asyncio
+async def test_stream_forecast_base_class() -> None:
+    """Api implementations without streaming yields from the whole result"""
+    smhi = Smhi("17.0", "62.1", api=FakeSmhiApi())
+
+    assert [as_tuple(item) for item in smhi.stream_forecast()] == hourly_forecasts()
+    assert [
+        as_tuple(item) async for item in smhi.async_stream_forecast()
+    ] == hourly_forecasts()
+
+
+def test_stream_forecast_error_status(local_api_url) -> None:
+    """Non 200 status raises SmhiForecastException"""
+    local_api_url.responder = lambda handler: (500, {}, b"")
+    api = SmhiAPI()
+
+    with pytest.raises(SmhiForecastException):
+        list(api.stream_forecast("17.0", "62.1"))
+    api.close()
+
+
+def test_json_loads_hook(local_api_url) -> None:
+    """The api decodes the bytes received with the loads given"""
+    decoded = []
+
+    def loads(data: bytes) -> dict:
+        decoded.append(type(data))
+        return json.loads(data)
+
+    api = SmhiAPI(loads=loads)
+    forecasts = Smhi("17.0", "62.1", api=api).get_forecast()
+    list(api.stream_forecast("17.0", "62.1"))
+    api.close()
+
+    assert len(forecasts) == 12
+    assert decoded[0] is bytes
+    assert len(decoded) == 1 + 71
+
+
+@pytest.mark.parametrize("loads", [json.loads, smhi_lib.JSON_LOADS])
+def test_json_loads_same_forecasts(local_api_url, loads) -> None:
+    """The default loads gives the same forecasts as the stdlib"""
+    api = SmhiAPI(loads=loads)
+    forecasts = Smhi("17.0", "62.1", api=api).get_forecast()
+    expected = Smhi("17.0", "62.1", api=FakeSmhiApi()).get_forecast()
+    api.close()
+
+    assert [as_tuple(item) for item in forecasts] == [
+        as_tuple(item) for item in expected
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate() -> None:
+    """A stale forecast is returned at once and refreshed in the background"""
+    clock = FakeClock()
+    api = SlowSmhiApi()
+    api.cache = SmhiForecastCache(ttl=10, max_stale=100, clock=clock)
+    refreshed = []
+    api.on_refresh = lambda lon, lat, forecasts: refreshed.append((lon, lat))
+    smhi = Smhi("17.041", "62.34198", api=api)
+    first = await smhi.async_get_forecast()
+
+    clock.now = 50
+    stale = await smhi.async_get_forecast()
+    assert stale == first
+    assert len(refreshed) == 1
+
+    while len(refreshed) < 2:
+        await asyncio.sleep(0.01)
+    assert api.calls == 2
+    assert api.cache.get("17.041", "62.34198").stored_at == 50
+    assert refreshed[1] == ("17.041", "62.34198")
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate_too_old() -> None:
+    """A forecast older than max_stale is fetched before it is returned"""
+    clock = FakeClock()
+    api = SlowSmhiApi()
+    api.cache = SmhiForecastCache(ttl=10, max_stale=100, clock=clock)
+    smhi = Smhi("17.041", "62.34198", api=api)
+    await smhi.async_get_forecast()
+
+    clock.now = 111
+    await smhi.async_get_forecast()
+    assert api.calls == 2
+    assert api.cache.get("17.041", "62.34198").stored_at == 111
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate_error() -> None:
+    """A failed background refresh keeps the stale forecast"""
+    clock = FakeClock()
+    api = SlowSmhiApi()
+    api.cache = SmhiForecastCache(ttl=10, max_stale=100, clock=clock)
+    smhi = Smhi("17.041", "62.34198", api=api)
+    await smhi.async_get_forecast()
+
+    clock.now = 50
+    api.error = SmhiForecastException("down")
+    assert len(await smhi.async_get_forecast()) == 12
+    await asyncio.sleep(0.05)
+    assert len(await smhi.async_get_forecast()) == 12
+    await asyncio.sleep(0.05)
+    assert api.calls == 3
+
+
+def test_reparse_keeps_stored_at() -> None:
+    """Parsing a cached result with other parameters does not make it fresh"""
+    clock = FakeClock()
+    api = CountingSmhiApi(cache=SmhiForecastCache(ttl=10, clock=clock))
+    smhi = Smhi("17.041", "62.34198", api=api)
+    smhi.get_forecast()
+    clock.now = 5
+    smhi.get_forecast(fields=["temperature"])
+
+    assert api.cache.get("17.041", "62.34198").stored_at == 0
+
+
 # Might have to rewrite this test at some point
 
 # def test_precipitation_mean_value(smhi):
@@ -292,6 +886,17 @@ async def test_async_error_from_api():
 #     assert True == False
 
 
+def test_package_imports_optional_modules_lazily():
+    """Importing the package does not pull in NumPy, sqlite3 or mmap"""
+    code = (
+        "import sys, smhi; "
+        "assert not {'numpy', 'sqlite3', 'mmap'} & set(sys.modules); "
+        "assert smhi.ForecastFrame and smhi.SmhiSqliteCache; "
+        "assert 'sqlite3' in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
 class FakeSmhiApi(SmhiAPIBase):
     """Implements fake class to return API data"""
 
@@ -10106,3 +10711,30 @@ class FakeSmhiApi(SmhiAPIBase):
                 },
             ],
         }
+
+
+class CountingSmhiApi(FakeSmhiApi):
+    """Fake api that counts the calls made to it"""
+
+    def __init__(self, cache=None) -> None:
+        self.cache = cache
+        self.calls = 0
+
+    def get_forecast_api(self, longitude: str, latitude: str) -> {}:
+        self.calls += 1
+        return super().get_forecast_api(longitude, latitude)
+
+
+class SlowSmhiApi(CountingSmhiApi):
+    """Fake api that takes a while to answer"""
+
+    def __init__(self, error: Exception = None) -> None:
+        super().__init__()
+        self.error = error
+
+    async def async_get_forecast_api(self, longitude: str, latitude: str) -> {}:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.error is not None:
+            raise self.error
+        return FakeSmhiApi.get_forecast_api(self, longitude, latitude)
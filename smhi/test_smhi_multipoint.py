@@ -0,0 +1,194 @@
+"""
+Automatic tests for the smhi_multipoint
+"""
+
+# pylint: disable=W0621
+
+import asyncio
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from smhi import smhi_multipoint
+from smhi.smhi_cache import SmhiForecastCache
+from smhi.smhi_lib import Smhi, SmhiForecastException, _get_forecast
+from smhi.smhi_multipoint import SmhiMultipointAPI
+from smhi.smhi_testing import FakeClock, json_body
+from smhi.test_smhi_lib import FakeSmhiApi, as_tuple
+
+POINTS = [[16.0, 63.3], [16.05, 63.3], [16.1, 63.3]]
+STEPS = 5
+
+_DATA = re.compile(
+    r"/validtime/(\w+)/parameter/(\w+)/leveltype/(\w+)/level/(\d+)/data.json"
+)
+
+
+def fixture_payload() -> dict:
+    """The first steps of the point fixture"""
+    json_data = FakeSmhiApi().get_forecast_api("", "")
+    json_data["timeSeries"] = json_data["timeSeries"][:STEPS]
+    return json_data
+
+
+def multipoint_responder(handler):
+    """Serves the point fixture as the grid, the temperature is one degree
+    higher for each grid point to the east"""
+    json_data = fixture_payload()
+    if handler.path.endswith("/multipoint.json"):
+        return (200, {}, json_body({"type": "MultiPoint", "coordinates": POINTS}))
+    if handler.path.endswith("/validtime.json"):
+        valid_times = [step["validTime"] for step in json_data["timeSeries"]]
+        return (200, {}, json_body({"validTime": valid_times}))
+
+    valid_time, name, level_type, level = _DATA.search(handler.path).groups()
+    for step in json_data["timeSeries"]:
+        if step["validTime"].replace("-", "").replace(":", "") != valid_time:
+            continue
+        for param in step["parameters"]:
+            if param["name"] != name:
+                continue
+            # Like the api there is no grid at another level
+            if (param["levelType"], param["level"]) != (level_type, int(level)):
+                return (404, {}, b"")
+            value = param["values"][0]
+            values = [value + index if name == "t" else value for index in range(3)]
+            return (
+                200,
+                {},
+                json_body(
+                    {
+                        "approvedTime": json_data["approvedTime"],
+                        "referenceTime": json_data["referenceTime"],
+                        "timeSeries": [
+                            {
+                                "validTime": step["validTime"],
+                                "parameters": [
+                                    {
+                                        "name": name,
+                                        "levelType": param["levelType"],
+                                        "level": param["level"],
+                                        "values": values,
+                                    }
+                                ],
+                            }
+                        ],
+                    }
+                ),
+            )
+    return (404, {}, b"")
+
+
+@pytest.fixture
+def multipoint_url(local_server, monkeypatch):
+    """Points the multipoint api to the local server"""
+    monkeypatch.setattr(
+        smhi_multipoint,
+        "MULTIPOINT_URL",
+        local_server.url + "/pmp3g/version/2/geotype/multipoint",
+    )
+    local_server.responder = multipoint_responder
+    return local_server
+
+
+def test_grid(multipoint_url):
+    """The grids of every parameter and valid time are assembled"""
+    api = SmhiMultipointAPI(parameters=["t", "Wsymb2"])
+    grid = api.fetch()
+    api.close()
+
+    assert len(grid) == 3
+    assert len(grid.valid_times) == STEPS
+    assert sorted(grid.parameters) == ["Wsymb2", "t"]
+    assert grid.values("t").shape == (STEPS, 3)
+    assert list(grid.values("t")[0]) == [17.0, 18.0, 19.0]
+    assert grid.approved_time == "2018-09-01T14:06:18Z"
+    assert len(multipoint_url.requests) == 2 + 2 * STEPS
+
+
+def test_point_forecasts_from_grid(multipoint_url):
+    """Point forecasts are answered from the grid without more requests"""
+    api = SmhiMultipointAPI()
+    forecasts = Smhi("16.001", "63.301", api=api).get_forecast()
+    requests = len(multipoint_url.requests)
+    east = Smhi("16.099", "63.299", api=api).get_forecast()
+    api.close()
+
+    assert [as_tuple(item) for item in forecasts] == [
+        as_tuple(item) for item in _get_forecast(fixture_payload())
+    ]
+    assert east[0].temperature == forecasts[0].temperature + 2
+    assert len(multipoint_url.requests) == requests
+
+
+@pytest.mark.asyncio
+async def test_async_point_forecasts_from_grid(multipoint_url):
+    """The async api fetches the grid once"""
+    async with Smhi("16.05", "63.3", api=SmhiMultipointAPI()) as smhi:
+        forecasts = await smhi.async_get_forecast()
+        await smhi.async_get_forecast()
+
+    assert forecasts[0].temperature == 18
+    assert len(multipoint_url.requests) == 2 + 12 * STEPS
+
+
+def test_outside_grid(multipoint_url):
+    """Coordinates outside the grid raises SmhiForecastException"""
+    api = SmhiMultipointAPI(parameters=["t"])
+    with pytest.raises(SmhiForecastException):
+        api.get_forecast_api("18.0", "59.3")
+    api.close()
+
+
+@pytest.mark.asyncio
+async def test_async_concurrent_coordinates_share_fetch(multipoint_url):
+    """Concurrent calls for different coordinates fetch the grid once"""
+    async with SmhiMultipointAPI(parameters=["t"]) as api:
+        results = await asyncio.gather(
+            *[api.async_get_forecast_api(str(lon), str(lat)) for lon, lat in POINTS]
+        )
+
+    assert [result["geometry"]["coordinates"][0] for result in results] == POINTS
+    assert len(multipoint_url.requests) == 2 + STEPS
+
+
+def test_threads_share_fetch(multipoint_url):
+    """Calls from many threads fetch the grid once"""
+    api = SmhiMultipointAPI(parameters=["t"])
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(lambda point: api.get_forecast_api(*point), POINTS))
+    api.close()
+
+    assert len(multipoint_url.requests) == 2 + STEPS
+
+
+def test_grid_refetched_after_ttl(multipoint_url):
+    """A grid older than the ttl of the cache is fetched again"""
+    clock = FakeClock()
+    api = SmhiMultipointAPI(
+        parameters=["t"], cache=SmhiForecastCache(ttl=10), clock=clock
+    )
+    api.get_forecast_api("16.0", "63.3")
+    clock.now = 10
+    api.get_forecast_api("16.0", "63.3")
+    assert len(multipoint_url.requests) == 2 + STEPS
+
+    clock.now = 11
+    api.get_forecast_api("16.0", "63.3")
+    api.close()
+    assert len(multipoint_url.requests) == 2 * (2 + STEPS)
+
+
+def test_grid_invalidated_by_newer_model_run(multipoint_url):
+    """invalidate_older drops a grid from an older model run only"""
+    api = SmhiMultipointAPI(parameters=["t"])
+    grid = api.fetch()
+    api.invalidate_older("2018-09-01T14:06:18Z")
+    assert api.grid is grid
+
+    api.invalidate_older("2018-09-01T15:06:18Z")
+    assert api.grid is None
+    api.get_forecast_api("16.0", "63.3")
+    api.close()
+    assert len(multipoint_url.requests) == 2 * (2 + STEPS)
@@ -0,0 +1,225 @@
+"""
+Automatic tests for the smhi_sqlite
+"""
+
+# pylint: disable=W0621
+
+import sqlite3
+
+import pytest
+from smhi.smhi_cache import SmhiForecastCache
+from smhi.smhi_lib import Smhi
+from smhi.smhi_sqlite import SmhiSqliteCache
+from smhi.smhi_testing import FakeClock
+from smhi.test_smhi_lib import CountingSmhiApi, as_tuple
+
+
+@pytest.fixture
+def database(tmp_path) -> str:
+    """Path of a database in a temporary directory"""
+    return str(tmp_path / "forecasts.db")
+
+
+def result(approved_time: str, value: float = 1.0) -> dict:
+    """Minimal api result"""
+    return {"approvedTime": approved_time, "timeSeries": [{"value": value}]}
+
+
+def test_put_get(database):
+    """A stored result is returned with the time it was stored"""
+    clock = FakeClock()
+    clock.now = 100
+    cache = SmhiSqliteCache(database, clock=clock)
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+
+    assert cache.get("17.0", "62.1") == (result("2018-09-01T14:00:00Z"), 100)
+    assert cache.get("17.0", "62.2") is None
+    assert len(cache) == 1
+
+
+def test_wal_shared_between_connections(database):
+    """Results written by one process are seen by another"""
+    writer = SmhiSqliteCache(database)
+    reader = SmhiSqliteCache(database)
+    writer.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+
+    assert reader.get("17.0", "62.1")[0] == result("2018-09-01T14:00:00Z")
+    with sqlite3.connect(database) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    writer.close()
+    reader.close()
+
+
+def test_newer_model_run_replaces_older(database):
+    """Only the latest approvedTime of a coordinate is kept"""
+    cache = SmhiSqliteCache(database)
+    cache.put("17.0", "62.1", result("2018-09-01T15:00:00Z", 2.0))
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z", 1.0))
+    assert cache.get("17.0", "62.1")[0] == result("2018-09-01T15:00:00Z", 2.0)
+
+    cache.put("17.0", "62.1", result("2018-09-01T16:00:00Z", 3.0))
+    assert len(cache) == 1
+    assert cache.invalidate_older("2018-09-01T17:00:00Z") == 1
+    assert cache.get("17.0", "62.1") is None
+
+
+def test_size_bounded_eviction(database):
+    """The least recently used results are evicted above max_bytes"""
+    clock = FakeClock()
+    cache = SmhiSqliteCache(database, clock=clock)
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+    size = cache.size
+
+    cache = SmhiSqliteCache(database, max_bytes=size * 2, clock=clock)
+    clock.now = 100
+    cache.put("17.0", "62.2", result("2018-09-01T14:00:00Z"))
+    clock.now = 200
+    cache.get("17.0", "62.1")
+    clock.now = 300
+    cache.put("17.0", "62.3", result("2018-09-01T14:00:00Z"))
+
+    assert cache.size <= size * 2
+    assert cache.get("17.0", "62.2") is None
+    assert cache.get("17.0", "62.1") is not None
+    assert cache.get("17.0", "62.3") is not None
+
+
+def test_access_time_updated_lazily(database):
+    """Reads within access_interval of the last use do not write"""
+    clock = FakeClock()
+    cache = SmhiSqliteCache(database, clock=clock, access_interval=60)
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+
+    def accessed_at():
+        with sqlite3.connect(database) as conn:
+            return conn.execute("SELECT accessed_at FROM forecasts").fetchone()[0]
+
+    clock.now = 60
+    cache.get("17.0", "62.1")
+    assert accessed_at() == 0
+    clock.now = 61
+    cache.get("17.0", "62.1")
+    assert accessed_at() == 61
+
+
+def test_get_while_locked(database):
+    """Reads are served while another connection holds the write lock"""
+    clock = FakeClock()
+    backend = SmhiSqliteCache(database, clock=clock, timeout=0.05)
+    backend.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+    cache = SmhiForecastCache(backend=backend, clock=clock)
+
+    writer = sqlite3.connect(database, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        clock.now = 120
+        assert backend.get("17.0", "62.1")[0] == result("2018-09-01T14:00:00Z")
+        assert cache.get("17.0", "62.1") is not None
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    clock.now = 240
+    assert backend.get("17.0", "62.1") is not None
+
+
+def test_size_kept_by_triggers(database):
+    """The running size follows replaced, evicted and removed results"""
+    cache = SmhiSqliteCache(database)
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z", 10.0))
+    cache.put("17.0", "62.1", result("2018-09-01T15:00:00Z", 100.0))
+    cache.put("17.0", "62.2", result("2018-09-01T15:00:00Z"))
+
+    with sqlite3.connect(database) as conn:
+        total = conn.execute("SELECT SUM(size) FROM forecasts").fetchone()[0]
+    assert cache.size == total
+    cache.invalidate("17.0", "62.2")
+    cache.clear()
+    assert cache.size == 0
+
+    # A database from before the running size gets it on open
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+    size = cache.size
+    with sqlite3.connect(database) as conn:
+        conn.executescript(
+            "DROP TRIGGER forecasts_size_insert;"
+            "DROP TRIGGER forecasts_size_delete;"
+            "DROP TABLE forecasts_size;"
+        )
+    assert SmhiSqliteCache(database).size == size
+
+
+def test_invalid_max_bytes(database):
+    """max_bytes must be positive"""
+    with pytest.raises(ValueError):
+        SmhiSqliteCache(database, max_bytes=0)
+
+
+def test_forecast_cache_backend(database):
+    """A restarted process serves the forecast from disk"""
+    clock = FakeClock()
+    api = CountingSmhiApi(
+        cache=SmhiForecastCache(backend=SmhiSqliteCache(database, clock=clock))
+    )
+    expected = [
+        as_tuple(forecast)
+        for forecast in Smhi("17.041", "62.34198", api=api).get_forecast()
+    ]
+
+    restarted = CountingSmhiApi(
+        cache=SmhiForecastCache(backend=SmhiSqliteCache(database, clock=clock))
+    )
+    forecasts = Smhi("17.041", "62.34198", api=restarted).get_forecast()
+
+    assert restarted.calls == 0
+    assert [as_tuple(forecast) for forecast in forecasts] == expected
+
+
+def test_forecast_cache_backend_ttl(database):
+    """Results older than the ttl on disk are fetched again"""
+    clock = FakeClock()
+    api = CountingSmhiApi(
+        cache=SmhiForecastCache(backend=SmhiSqliteCache(database, clock=clock))
+    )
+    Smhi("17.041", "62.34198", api=api).get_forecast()
+
+    clock.now = 601
+    restarted = CountingSmhiApi(
+        cache=SmhiForecastCache(backend=SmhiSqliteCache(database, clock=clock))
+    )
+    Smhi("17.041", "62.34198", api=restarted).get_forecast()
+
+    assert restarted.calls == 1
+
+
+def test_warm_start(database):
+    """Warm start loads the results on disk into memory"""
+    clock = FakeClock()
+    backend = SmhiSqliteCache(database, clock=clock)
+    backend.put("17.0", "62.1", result("2018-09-01T14:00:00Z"))
+    clock.now = 1
+    backend.put("17.0", "62.2", result("2018-09-01T14:00:00Z"))
+
+    cache = SmhiForecastCache(max_entries=1, backend=backend)
+    assert cache.warm_start() == 1
+    assert len(cache) == 1
+    assert cache.peek("17.0", "62.2").json_data == result("2018-09-01T14:00:00Z")
+
+    assert SmhiForecastCache().warm_start() == 0
+
+
+def test_forecast_cache_backend_invalidate(database):
+    """Invalidated entries are removed from disk too"""
+    backend = SmhiSqliteCache(database)
+    cache = SmhiForecastCache(backend=backend)
+    cache.put("17.0", "62.1", result("2018-09-01T14:00:00Z"), [])
+    cache.put("17.0", "62.2", result("2018-09-01T15:00:00Z"), [])
+    cache.put("17.0", "62.3", result("2018-09-01T15:00:00Z"), [])
+
+    cache.invalidate("17.0", "62.2")
+    cache.invalidate_older("2018-09-01T15:00:00Z")
+    assert len(backend) == 1
+
+    cache.clear()
+    assert len(backend) == 0
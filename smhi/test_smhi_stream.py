@@ -0,0 +1,58 @@
+"""
+Automatic tests for the smhi_stream
+"""
+
+import json
+
+import pytest
+from smhi.smhi_stream import SmhiTimeSeriesParser
+from smhi.test_smhi_lib import FakeSmhiApi
+
+
+def payload() -> dict:
+    """Returns the fixture with strings that looks like structure"""
+    json_data = FakeSmhiApi().get_forecast_api("", "")
+    json_data["approvedTime"] = 'x" ["timeSeries"] {\\'
+    json_data["timeSeries"][3]["parameters"][0]["unit"] = 'a\\"}]{["'
+    return json_data
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1 << 20])
+def test_parser_chunks(size):
+    """Entries are the same for any chunk size"""
+    json_data = payload()
+    body = json.dumps(json_data).encode("utf-8")
+    parser = SmhiTimeSeriesParser()
+    entries = []
+    for index in range(0, len(body), size):
+        entries.extend(parser.feed(body[index : index + size]))
+    parser.close()
+
+    assert parser.done
+    assert entries == json_data["timeSeries"]
+
+
+def test_parser_yields_while_receiving():
+    """Each entry is decoded when complete and the buffer stays small"""
+    json_data = payload()
+    body = json.dumps(json_data).encode("utf-8")
+    entry_size = max(len(json.dumps(entry)) for entry in json_data["timeSeries"])
+    parser = SmhiTimeSeriesParser()
+    counts = []
+    for index in range(0, len(body), 256):
+        counts.append(len(parser.feed(body[index : index + 256])))
+        assert len(parser._buffer) <= entry_size + 256
+
+    assert sum(counts) == len(json_data["timeSeries"])
+    # The first entry is decoded long before the body is received
+    assert next(i for i, count in enumerate(counts) if count) < len(counts) / 20
+
+
+def test_parser_incomplete():
+    """A body ending before the end of timeSeries raises ValueError"""
+    body = json.dumps(payload()).encode("utf-8")
+    parser = SmhiTimeSeriesParser()
+    parser.feed(body[: len(body) // 2])
+
+    with pytest.raises(ValueError):
+        parser.close()
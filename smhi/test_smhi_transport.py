@@ -0,0 +1,272 @@
+"""
+Automatic tests for the smhi_transport
+"""
+
+# pylint: disable=W0621,W0212
+
+import gzip
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from smhi import smhi_lib
+from smhi.smhi_lib import SmhiAPI, SmhiForecastException
+from smhi.smhi_transport import SmhiConnectionPool, SmhiContentDecoder
+from smhi.smhi_testing import json_body
+
+
+def test_pool_reuses_connection(local_server):
+    """Consecutive requests share one keep-alive connection"""
+    pool = SmhiConnectionPool()
+    for _ in range(5):
+        response = pool.request(local_server.url + "/data.json")
+        assert response.status == 200
+        assert response.body == b"{}"
+    pool.close()
+
+    assert local_server.connections == 1
+    assert len(local_server.requests) == 5
+
+
+def test_pool_size_bounds_connections(local_server):
+    """Threads never open more connections than the pool size"""
+    pool = SmhiConnectionPool(pool_size=2)
+
+    def fetch(_):
+        return pool.request(local_server.url + "/data.json").status
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(fetch, range(40)))
+    pool.close()
+
+    assert statuses == [200] * 40
+    assert local_server.connections <= 2
+
+
+def test_pool_idle_timeout(local_server):
+    """Connections idle longer than the timeout are not reused"""
+    pool = SmhiConnectionPool(idle_timeout=0)
+    pool.request(local_server.url + "/data.json")
+    pool.request(local_server.url + "/data.json")
+    pool.close()
+
+    assert local_server.connections == 2
+
+
+def test_pool_honours_connection_close(local_server):
+    """A connection the server closes is not put back in the pool"""
+    pool = SmhiConnectionPool()
+    pool.request(local_server.url + "/data.json")
+    local_server.responder = lambda handler: (200, {"Connection": "close"}, b"{}")
+    pool.request(local_server.url + "/data.json")
+    local_server.responder = lambda handler: (200, {}, b"{}")
+    assert pool.request(local_server.url + "/data.json").status == 200
+    pool.close()
+
+    assert local_server.connections == 2
+
+
+def test_pool_stream(local_server):
+    """Streamed bodies are read in chunks, a partly read connection is
+    not put back in the pool"""
+    local_server.responder = lambda handler: (200, {}, PAYLOAD)
+    pool = SmhiConnectionPool()
+    with pool.stream(local_server.url + "/data.json") as response:
+        assert b"".join(response.iter_chunks()) == PAYLOAD
+    with pool.stream(local_server.url + "/data.json") as response:
+        next(response.iter_chunks())
+    pool.request(local_server.url + "/data.json")
+    pool.close()
+
+    assert local_server.connections == 2
+    assert pool.stats.responses == 2
+
+
+def test_pool_invalid_size():
+    """The pool must allow at least one connection"""
+    with pytest.raises(ValueError):
+        SmhiConnectionPool(pool_size=0)
+
+
+def test_api_uses_pool(local_server, monkeypatch):
+    """The sync api call goes through the pool"""
+    monkeypatch.setattr(
+        smhi_lib, "APIURL_TEMPLATE", local_server.url + "/lon/{}/lat/{}/data.json"
+    )
+    local_server.responder = lambda handler: (200, {}, json_body({"timeSeries": []}))
+    api = SmhiAPI(pool_size=1)
+
+    assert api.get_forecast_api("17.0", "62.1") == {"timeSeries": []}
+    assert api.get_forecast_api("17.0", "62.1") == {"timeSeries": []}
+    api.close()
+
+    assert local_server.connections == 1
+    assert local_server.requests[0][0] == "/lon/17.0/lat/62.1/data.json"
+
+
+def test_api_error_status(local_server, monkeypatch):
+    """Non 200 status raises SmhiForecastException"""
+    monkeypatch.setattr(
+        smhi_lib, "APIURL_TEMPLATE", local_server.url + "/lon/{}/lat/{}/data.json"
+    )
+    local_server.responder = lambda handler: (404, {}, b"")
+    api = SmhiAPI()
+
+    with pytest.raises(SmhiForecastException):
+        api.get_forecast_api("17.0", "62.1")
+    api.close()
+
+
+PAYLOAD = json_body(
+    {"timeSeries": [{"name": "t", "levelType": "hl", "values": [12.3]}] * 200}
+)
+
+
+def compressing_responder(handler):
+    """Compresses the payload with the first accepted encoding"""
+    accepted = handler.headers.get("Accept-Encoding", "")
+    if "gzip" in accepted:
+        return (200, {"Content-Encoding": "gzip"}, gzip.compress(PAYLOAD))
+    return (200, {}, PAYLOAD)
+
+
+def test_pool_compression(local_server):
+    """Compressed responses are decoded and counted"""
+    local_server.responder = compressing_responder
+    pool = SmhiConnectionPool()
+    response = pool.request(local_server.url + "/data.json")
+    pool.close()
+
+    assert response.body == PAYLOAD
+    assert pool.stats.responses == 1
+    assert pool.stats.bytes_decoded == len(PAYLOAD)
+    assert pool.stats.bytes_received < len(PAYLOAD) / 10
+    assert pool.stats.bytes_saved > 0
+
+
+def test_pool_without_compression(local_server):
+    """Without compression identity is requested"""
+    local_server.responder = compressing_responder
+    pool = SmhiConnectionPool(compression=False)
+    response = pool.request(local_server.url + "/data.json")
+    pool.close()
+
+    assert response.body == PAYLOAD
+    assert local_server.requests[0][1]["Accept-Encoding"] == "identity"
+    assert pool.stats.bytes_received == pool.stats.bytes_decoded
+
+
+@pytest.mark.parametrize(
+    "encoding, data",
+    [
+        ("gzip", gzip.compress(PAYLOAD)),
+        ("deflate", zlib.compress(PAYLOAD)),
+        ("deflate", zlib.compress(PAYLOAD)[2:-4]),
+        ("identity", PAYLOAD),
+        (None, PAYLOAD),
+    ],
+)
+def test_content_decoder_streaming(encoding, data):
+    """Chunks of any size are decoded"""
+    decoder = SmhiContentDecoder(encoding)
+    decoded = b"".join(
+        decoder.decompress(data[i : i + 7]) for i in range(0, len(data), 7)
+    )
+
+    assert decoded + decoder.flush() == PAYLOAD
+
+
+def test_content_decoder_unsupported():
+    """Unknown encodings raises ValueError"""
+    with pytest.raises(ValueError):
+        SmhiContentDecoder("compress")
+
+
+@pytest.mark.asyncio
+async def test_async_api_compression(local_server, monkeypatch):
+    """The async api decodes compressed responses and counts them"""
+    monkeypatch.setattr(
+        smhi_lib, "APIURL_TEMPLATE", local_server.url + "/lon/{}/lat/{}/data.json"
+    )
+    local_server.responder = compressing_responder
+    async with SmhiAPI() as api:
+        json_data = await api.async_get_forecast_api("17.0", "62.1")
+
+    assert len(json_data["timeSeries"]) == 200
+    assert api.stats.bytes_decoded == len(PAYLOAD)
+    assert api.stats.bytes_received < len(PAYLOAD) / 10
+
+
+def test_pool_http_proxy(local_server):
+    """Plain http is sent to the proxy with the whole url"""
+    pool = SmhiConnectionPool(
+        proxies={"http": "http://user:secret@" + local_server.url[len("http://") :]}
+    )
+    response = pool.request("http://opendata.example/data.json")
+    pool.close()
+
+    assert response.status == 200
+    path, headers = local_server.requests[0]
+    assert path == "http://opendata.example/data.json"
+    assert headers["Host"] == "opendata.example"
+    assert headers["Proxy-Authorization"] == "Basic dXNlcjpzZWNyZXQ="
+
+
+def test_pool_no_proxy(local_server):
+    """Hosts in no are not proxied"""
+    pool = SmhiConnectionPool(
+        proxies={"http": "http://proxy.invalid:3128", "no": "127.0.0.1"}
+    )
+    pool.request(local_server.url + "/data.json")
+    pool.close()
+
+    assert local_server.requests[0][0] == "/data.json"
+
+
+def test_pool_proxy_from_environment(monkeypatch):
+    """HTTPS_PROXY tunnels https through the proxy unless in NO_PROXY"""
+    for name in ("http_proxy", "https_proxy", "no_proxy"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.example:3128")
+    monkeypatch.setenv("NO_PROXY", "internal.example")
+
+    pool = SmhiConnectionPool()
+    conn = pool._connect(("https", "opendata.example", None))
+    assert (conn.host, conn.port) == ("proxy.example", 3128)
+    assert conn._tunnel_host == "opendata.example"
+
+    conn = pool._connect(("https", "internal.example", None))
+    assert conn.host == "internal.example"
+    assert conn._tunnel_host is None
+
+
+def test_pool_closes_failed_retry(local_server, monkeypatch):
+    """The new connection of a failed retry is closed"""
+    connections = []
+
+    class FailingConnection:
+        """Connection that fails every request"""
+
+        def __init__(self) -> None:
+            self.closed = False
+            connections.append(self)
+
+        def close(self) -> None:
+            self.closed = True
+
+    def send(conn, path, headers):
+        raise ConnectionResetError()
+
+    pool = SmhiConnectionPool()
+    key = ("http", "127.0.0.1", local_server.server_address[1])
+    pool._checkin(key, FailingConnection())
+    monkeypatch.setattr(pool, "_connect", lambda key: FailingConnection())
+    monkeypatch.setattr(pool, "_send", send)
+
+    with pytest.raises(ConnectionResetError):
+        pool.request(local_server.url + "/data.json")
+
+    assert len(connections) == 2
+    assert all(conn.closed for conn in connections)
@@ -0,0 +1,183 @@
+"""
+Automatic tests for the smhi_watcher
+"""
+
+# pylint: disable=W0621,W0212
+
+import asyncio
+
+import pytest
+from smhi import smhi_lib
+from smhi.smhi_cache import SmhiForecastCache
+from smhi.smhi_lib import SmhiAPI
+from smhi.smhi_watcher import SmhiApprovedTimeWatcher
+from smhi.smhi_testing import json_body
+from smhi.test_smhi_lib import FakeSmhiApi
+
+FIRST_RUN = "2018-09-01T14:06:18Z"
+SECOND_RUN = "2018-09-01T15:06:18Z"
+
+
+@pytest.fixture
+def watched_server(local_server, monkeypatch):
+    """Serves the approved time in local_server.approved_time and forecasts
+    from that model run"""
+    monkeypatch.setattr(
+        smhi_lib, "APIURL_TEMPLATE", local_server.url + "/lon/{}/lat/{}/data.json"
+    )
+    monkeypatch.setattr(
+        smhi_lib, "APPROVED_TIME_URL", local_server.url + "/approvedtime.json"
+    )
+    local_server.approved_time = FIRST_RUN
+
+    def responder(handler):
+        if handler.path == "/approvedtime.json":
+            data = {"approvedTime": local_server.approved_time}
+        else:
+            data = FakeSmhiApi().get_forecast_api("", "")
+            data["approvedTime"] = local_server.approved_time
+        return (200, {}, json_body(data))
+
+    local_server.responder = responder
+    return local_server
+
+
+def forecast_requests(server) -> int:
+    """Number of forecasts requested from the server"""
+    return len([path for path, _ in server.requests if path.startswith("/lon/")])
+
+
+@pytest.mark.asyncio
+async def test_check_invalidates_older(watched_server):
+    """Forecasts from older model runs are removed from the cache"""
+    api = SmhiAPI(cache=SmhiForecastCache())
+    changes = []
+    watcher = SmhiApprovedTimeWatcher(api, jitter=0, on_change=changes.append)
+    async with api:
+        await api.async_get_forecast("17.0", "62.1")
+
+        assert await watcher.check()
+        assert len(api.cache) == 1
+        assert not await watcher.check()
+
+        watched_server.approved_time = SECOND_RUN
+        assert await watcher.check()
+        assert len(api.cache) == 0
+
+    assert changes == [FIRST_RUN, SECOND_RUN]
+    assert forecast_requests(watched_server) == 1
+
+
+@pytest.mark.asyncio
+async def test_check_refreshes(watched_server):
+    """With refresh the forecasts from older model runs are fetched again"""
+    api = SmhiAPI(cache=SmhiForecastCache())
+    watcher = SmhiApprovedTimeWatcher(api, jitter=0, refresh=True)
+    async with api:
+        await api.async_get_forecast("17.0", "62.1", frozenset(["t"]))
+        watched_server.approved_time = SECOND_RUN
+        await watcher.check()
+
+    entry = api.cache.get("17.0", "62.1")
+    assert entry.approved_time == SECOND_RUN
+    assert entry.parameters == frozenset(["t"])
+    assert forecast_requests(watched_server) == 2
+    assert watcher.last_error is None
+
+
+@pytest.mark.asyncio
+async def test_run_polls(watched_server):
+    """The watcher polls until stopped"""
+    changes = []
+    watcher = SmhiApprovedTimeWatcher(
+        SmhiAPI(), interval=0.01, jitter=0, on_change=changes.append
+    )
+    async with watcher:
+        assert watcher.running
+        while not changes:
+            await asyncio.sleep(0.01)
+        watched_server.approved_time = SECOND_RUN
+        while len(changes) < 2:
+            await asyncio.sleep(0.01)
+
+    assert not watcher.running
+    assert changes == [FIRST_RUN, SECOND_RUN]
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_errors(watched_server):
+    """Errors does not stop the polling"""
+    watched_server.responder = lambda handler: (503, {}, b"")
+    watcher = SmhiApprovedTimeWatcher(SmhiAPI(), interval=0.01, jitter=0)
+    async with watcher:
+        while watcher.last_error is None:
+            await asyncio.sleep(0.01)
+        assert watcher.running
+
+
+async def wait_for_error(watcher: SmhiApprovedTimeWatcher, kind: type) -> None:
+    """Waits until the watcher has kept an error of the kind"""
+    while not isinstance(watcher.last_error, kind):
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_any_error(watched_server):
+    """Timeouts and errors from on_change does not stop the polling"""
+
+    def on_change(approved_time):
+        raise RuntimeError(approved_time)
+
+    watcher = SmhiApprovedTimeWatcher(
+        TimeoutSmhiApi(), interval=0.01, jitter=0, on_change=on_change
+    )
+    async with watcher:
+        await asyncio.wait_for(wait_for_error(watcher, TimeoutError), 5)
+        assert watcher.running
+
+        watcher._api.timeout = False
+        await asyncio.wait_for(wait_for_error(watcher, RuntimeError), 5)
+        assert watcher.running
+
+
+@pytest.mark.asyncio
+async def test_check_cancelled_in_jitter(watched_server):
+    """A model run is seen as new again if the check was cancelled before
+    it was acted on"""
+    api = SmhiAPI(cache=SmhiForecastCache())
+    async with api:
+        await api.async_get_forecast("17.0", "62.1")
+        watched_server.approved_time = SECOND_RUN
+
+        watcher = SmhiApprovedTimeWatcher(api, jitter=10)
+        watcher.approved_time = FIRST_RUN
+        check = asyncio.ensure_future(watcher.check())
+        await asyncio.sleep(0.1)
+        check.cancel()
+        await asyncio.gather(check, return_exceptions=True)
+        assert watcher.approved_time == FIRST_RUN
+        assert len(api.cache) == 1
+
+        watcher._jitter = 0
+        assert await watcher.check()
+        assert watcher.approved_time == SECOND_RUN
+        assert len(api.cache) == 0
+
+
+def test_invalid_interval():
+    """Negative interval or jitter raises ValueError"""
+    with pytest.raises(ValueError):
+        SmhiApprovedTimeWatcher(SmhiAPI(), interval=-1)
+
+
+class TimeoutSmhiApi(SmhiAPI):
+    """Api whose approvedtime requests times out while timeout is set"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.timeout = True
+
+    async def async_get_approved_time_api(self) -> dict:
+        if self.timeout:
+            raise TimeoutError()
+        return await super().async_get_approved_time_api()